@@ -1,22 +1,31 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import hashlib
 import json
 import logging
 import os
 import re
 import sys
 import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Awaitable, BinaryIO, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
-from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
 # Allow running `python server/server.py` without installing as a package.
 SERVER_DIR = Path(__file__).resolve().parent
 if str(SERVER_DIR) not in sys.path:
@@ -42,6 +51,7 @@ DEFAULT_SOURCE_NAME = "text.txt"
 DOC_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
 FORM_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
 PANEL_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+_ID_INVALID_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
 
 DEFAULT_FORM_ID = "feedback"
 DEFAULT_FORM_QUESTION = "Share your thoughts with us."
@@ -56,26 +66,262 @@ BUTTON_DEFINITIONS = [
     {"id": "speed", "label": "Speed"},
 ]
 DEFAULT_BUTTON_SEQUENCE = [item["id"] for item in BUTTON_DEFINITIONS]
+_BUTTON_ORDER = {bid: idx for idx, bid in enumerate(DEFAULT_BUTTON_SEQUENCE)}
+_DEFAULT_BUTTON_TEMPLATE = {
+    item["id"]: {"label": item["label"], "minus": 0, "plus": 0} for item in BUTTON_DEFINITIONS
+}
 MAX_BUTTON_EVENTS = 1000
 
+FSYNC_MODES = ("always", "never", "interval")
+FSYNC_MODE = (os.getenv("HL_FSYNC") or "interval").strip().lower()
+if FSYNC_MODE not in FSYNC_MODES:
+    LOGGER.warning("Unknown HL_FSYNC=%r, falling back to 'interval'", FSYNC_MODE)
+    FSYNC_MODE = "interval"
+FSYNC_INTERVAL = float(os.getenv("HL_FSYNC_INTERVAL", "5"))
+FLUSH_INTERVAL = float(os.getenv("HL_FLUSH_INTERVAL", "0.25"))
+LOG_COMPACT_BYTES = int(os.getenv("HL_LOG_COMPACT_BYTES", str(1024 * 1024)))
+GZIP_MIN_BYTES = int(os.getenv("HL_GZIP_MIN_BYTES", "1024"))
+LOCK_STRIPES = 64
+BROADCAST_BATCH_SIZE = 50
+# Document versions restart with the process, so ETags carry a per-process prefix.
+ETAG_EPOCH = f"{os.getpid():x}.{time.time_ns():x}"
+
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 WWWDOCS_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+
+    def _dumps(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects ints beyond 64 bits and non-str keys that json accepts.
+            return _json_dumps(obj)
+
+    _loads = orjson.loads
+
+    def _load_state_file(raw: bytes) -> Any:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Files written by stdlib json may hold NaN/Infinity, which orjson refuses.
+            return json.loads(raw)
+
+    class _FastJSONResponse(ORJSONResponse):
+        def render(self, content: Any) -> bytes:
+            return _dumps(content)
+
+    JSON_RESPONSE_CLASS = _FastJSONResponse
+else:
+    _dumps = _json_dumps
+    _loads = json.loads
+    _load_state_file = json.loads
+    JSON_RESPONSE_CLASS = JSONResponse
+
+
+def _fsync_due(last_fsync_ts: Dict[str, float], key: str) -> bool:
+    """Decide whether the next write for *key* should be fsynced under HL_FSYNC."""
+    if FSYNC_MODE == "always":
+        return True
+    if FSYNC_MODE == "never":
+        return False
+    now = time.monotonic()
+    last = last_fsync_ts.get(key)
+    if last is not None and now - last < FSYNC_INTERVAL:
+        return False
+    last_fsync_ts[key] = now
+    return True
+
+
+_TMP_OPEN_FLAGS = (
+    os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0)
+)
+
+
+_dir_sync_pending = False
+
+
+def _request_dir_sync() -> None:
+    global _dir_sync_pending
+    _dir_sync_pending = True
+
+
+def _sync_data_dir() -> None:
+    """fsync DATA_DIR once if any fsynced write replaced a file since the last call."""
+    global _dir_sync_pending
+    if not _dir_sync_pending:
+        return
+    _dir_sync_pending = False
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # Windows cannot open directories for fsync.
+    try:
+        fd = os.open(DATA_DIR, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as exc:
+        LOGGER.error("Failed to fsync %s: %s", DATA_DIR, exc)
+
+
+def _atomic_write_json(path: Path, payload: Dict[str, Any], fsync: bool = True) -> None:
+    """Write *payload* to a temp file next to *path* and atomically swap it into place."""
+    # Writes never interleave inside one event loop, so a per-process name is enough.
+    tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    data = memoryview(_dumps(payload))
+    replaced = False
+    fd = os.open(tmp_path, _TMP_OPEN_FLAGS, 0o644)
+    try:
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+        replaced = True
+        if fsync:
+            # The rename itself is made durable by the flusher's batched directory fsync.
+            _request_dir_sync()
+    finally:
+        if not replaced:
+            tmp_path.unlink(missing_ok=True)
+
+
+def _scan_data_ids(prefix: str, suffix: str = ".json") -> List[str]:
+    """Return the ids of DATA_DIR files named ``<prefix><id><suffix>``."""
+    start, stop = len(prefix), -len(suffix)
+    with os.scandir(DATA_DIR) as entries:
+        return [
+            entry.name[start:stop]
+            for entry in entries
+            if entry.name.startswith(prefix) and entry.name.endswith(suffix)
+        ]
+
+
+async def _flush_dirty(
+    dirty: Dict[str, Any],
+    lock_for: Callable[[str], asyncio.Lock],
+    write: Callable[[str, Any], None],
+) -> None:
+    """Persist every pending entry of *dirty*, holding the owning lock per key."""
+    for key in list(dirty):
+        async with lock_for(key):
+            state = dirty.pop(key, None)
+            if state is None:
+                continue
+            try:
+                write(key, state)
+            except Exception as exc:
+                LOGGER.error("Failed to flush %s: %s", key, exc)
+                dirty.setdefault(key, state)
+
+
+async def _run_flusher(flushes: List[Callable[[], Awaitable[None]]]) -> None:
+    """Drain every store once per FLUSH_INTERVAL and commit the batch with one directory fsync."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        for flush in flushes:
+            await flush()
+        _sync_data_dir()
+
+
+def _items_since(items: Deque[Dict[str, Any]], since: int) -> List[Dict[str, Any]]:
+    """Return the entries of a seq-ordered log whose ``seq`` is greater than *since*."""
+    # Logs are appended in seq order, so walk back from the newest entry and stop
+    # at the first old one: pollers only pay for what is new.
+    newer: List[Dict[str, Any]] = []
+    for item in reversed(items):
+        if item.get("seq", 0) <= since:
+            break
+        newer.append(item)
+    newer.reverse()
+    return newer
+
+
+class _LockPool:
+    """Fixed set of asyncio locks striped by key hash, so memory stays bounded per store."""
+
+    def __init__(self, size: int = LOCK_STRIPES) -> None:
+        # Locks are created on first use so they bind to the running event loop.
+        self._slots: List[Optional[asyncio.Lock]] = [None] * size
+
+    def __getitem__(self, key: str) -> asyncio.Lock:
+        idx = hash(key) % len(self._slots)
+        lock = self._slots[idx]
+        if lock is None:
+            lock = self._slots[idx] = asyncio.Lock()
+        return lock
+
+
+def _text_frame(message: Dict[str, Any]) -> Dict[str, str]:
+    """Encode *message* once as an ASGI text frame that every socket can reuse."""
+    # Clients JSON.parse text frames, so keep them text rather than bytes.
+    return {"type": "websocket.send", "text": _dumps(message).decode("utf-8")}
+
+
+async def _safe_send(ws: WebSocket, frame: Dict[str, str]) -> Optional[WebSocket]:
+    try:
+        await ws.send(frame)
+    except Exception:
+        return ws
+    return None
+
+
+async def _fan_out(targets: Sequence[WebSocket], frame: Dict[str, str]) -> List[WebSocket]:
+    """Send *frame* to all *targets* concurrently and return the sockets that failed."""
+    if len(targets) <= BROADCAST_BATCH_SIZE:
+        results = await asyncio.gather(*(_safe_send(ws, frame) for ws in targets))
+        return [ws for ws in results if ws is not None]
+    # Large audiences go out in batches, yielding between them so HTTP handlers keep running.
+    dead: List[WebSocket] = []
+    for offset in range(0, len(targets), BROADCAST_BATCH_SIZE):
+        if offset:
+            await asyncio.sleep(0)
+        batch = targets[offset:offset + BROADCAST_BATCH_SIZE]
+        results = await asyncio.gather(*(_safe_send(ws, frame) for ws in batch))
+        dead.extend(ws for ws in results if ws is not None)
+    return dead
+
+
 @dataclass
 class DocState:
     tokens: List[str] = field(default_factory=list)
-    votes: List[Dict[str, str]] = field(default_factory=list)
+    # client id -> {token index: color}; only tokens a client actually marked are stored.
+    votes_by_client: Dict[str, Dict[int, str]] = field(default_factory=dict)
     updated: Optional[float] = None
     source_name: str = DEFAULT_SOURCE_NAME
+    log_seq: int = 0
+    # break_mask[i] is 1 when tokens[i] splits highlight runs (see is_break_token).
+    break_mask: bytes = b""
+    # Bumped on every token or vote change; keys the derived-result caches below.
+    # (updated is unsuitable: it may carry a client-supplied timestamp.)
+    version: int = 0
+    ranges_cache: Optional[Tuple[int, List[Dict]]] = None
+    phrases_cache: Optional[Tuple[int, List[Dict]]] = None
 
 
 class DocumentStore:
     def __init__(self) -> None:
         self._states: Dict[str, DocState] = {}
-        self._locks: Dict[str, asyncio.Lock] = {}
+        self._locks = _LockPool()
         self._ws_connections: Dict[str, Set[WebSocket]] = {}
+        self._updated_frames: Dict[str, Dict[str, str]] = {}
         self._lock_flags: Dict[str, bool] = {}
+        self._last_fsync_ts: Dict[str, float] = {}
+        self._log_handles: Dict[str, BinaryIO] = {}
+        self._log_bytes: Dict[str, int] = {}
+        self._log_pending: Set[str] = set()
+        self._id_cache: Optional[List[str]] = None
+        self._id_cache_mtime: int = 0
+        # source name -> (st_size, st_mtime_ns, tokens) of the last tokenization.
+        self._src_cache: Dict[str, Tuple[int, int, List[str]]] = {}
 
     def _state_path(self, doc_id: str) -> Path:
         return DATA_DIR / f"state_{doc_id}.json"
@@ -83,12 +329,11 @@ class DocumentStore:
     def _jsonl_path(self, doc_id: str) -> Path:
         return DATA_DIR / f"state_{doc_id}.jsonl"
 
+    def _log_path(self, doc_id: str) -> Path:
+        return DATA_DIR / f"state_{doc_id}.events.jsonl"
+
     def _doc_lock(self, doc_id: str) -> asyncio.Lock:
-        lock = self._locks.get(doc_id)
-        if lock is None:
-            lock = asyncio.Lock()
-            self._locks[doc_id] = lock
-        return lock
+        return self._locks[doc_id]
 
     async def get_state(self, doc_id: str) -> DocState:
         state = self._states.get(doc_id)
@@ -98,45 +343,126 @@ class DocumentStore:
         return state
 
     def _load_state_from_disk(self, doc_id: str) -> DocState:
+        state = self._load_snapshot(doc_id)
+        self._replay_log(doc_id, state)
+        return state
+
+    def _load_snapshot(self, doc_id: str) -> DocState:
         path = self._state_path(doc_id)
         if not path.exists():
             return DocState()
         try:
-            with path.open("r", encoding="utf-8") as handle:
-                raw = json.load(handle)
+            raw = _load_state_file(path.read_bytes())
         except Exception as exc:
             LOGGER.error("Failed to load state for %s: %s", doc_id, exc)
             return DocState()
-        tokens = list(raw.get("tokens") or [])
-        votes = [dict(entry) for entry in (raw.get("votes") or [])]
+        tokens = raw.get("tokens") or []
+        if "votesByClient" in raw:
+            votes = _votes_from_runs(raw.get("votesByClient") or {})
+        else:
+            votes = _votes_from_token_list(raw.get("votes") or [])
         updated = raw.get("updated")
         source_name_raw = raw.get("sourceName")
         source_name = self._sanitize_source_name(source_name_raw) if source_name_raw else DEFAULT_SOURCE_NAME
-        state = DocState(tokens=tokens, votes=votes, updated=updated, source_name=source_name)
-        self._ensure_votes_length(state)
+        state = DocState(tokens=tokens, votes_by_client=votes, updated=updated, source_name=source_name)
+        state.break_mask = break_mask(tokens)
+        state.log_seq = int(raw.get("logSeq") or 0)
+        self._trim_votes(state)
         return state
 
+    def _replay_log(self, doc_id: str, state: DocState) -> None:
+        """Apply vote events appended after the snapshot was taken."""
+        path = self._log_path(doc_id)
+        try:
+            with path.open("rb") as handle:
+                lines = handle.readlines()
+        except FileNotFoundError:
+            return
+        except Exception as exc:
+            LOGGER.error("Failed to read event log for %s: %s", doc_id, exc)
+            return
+        if lines and not lines[-1].endswith(b"\n"):
+            # A torn tail from a crash mid-append; cut it so the next append starts a fresh line.
+            LOGGER.warning("Dropping torn event log tail for %s", doc_id)
+            torn = lines.pop()
+            try:
+                os.truncate(path, sum(len(line) for line in lines))
+            except OSError as exc:
+                LOGGER.error("Failed to truncate event log for %s: %s", doc_id, exc)
+                lines.append(torn)
+        self._log_bytes[doc_id] = sum(len(line) for line in lines)
+        n = len(state.tokens)
+        for line in lines:
+            try:
+                event = _loads(line)
+                seq = int(event["n"])
+            except Exception:
+                LOGGER.warning("Skipping unreadable event log line for %s", doc_id)
+                continue
+            if seq <= state.log_seq:
+                continue
+            kind = event.get("t")
+            if kind == "hl" and n:
+                start = max(0, min(int(event.get("s", 0)), n - 1))
+                end = max(0, min(int(event.get("e", start)), n - 1))
+                self._apply_range(state, str(event.get("c") or ""), start, end, event.get("col") or "")
+            elif kind == "cc":
+                self._clear_client_votes(state, str(event.get("c") or ""))
+            elif kind == "clr":
+                state.votes_by_client = {}
+            state.log_seq = seq
+            state.updated = event.get("ts", state.updated)
+
     async def save_state(self, doc_id: str, state: DocState) -> None:
-        self._ensure_votes_length(state)
+        self._write_state(doc_id, state)
+
+    def _append_event(self, doc_id: str, state: DocState, event: Dict[str, Any]) -> None:
+        """Record a vote mutation in the per-document log; the flusher pushes it to disk."""
+        state.version += 1
+        state.log_seq += 1
+        event["n"] = state.log_seq
+        event["ts"] = state.updated
+        line = _dumps(event) + b"\n"
+        handle = self._log_handles.get(doc_id)
+        if handle is None:
+            handle = self._log_path(doc_id).open("ab")
+            self._log_handles[doc_id] = handle
+        handle.write(line)
+        self._log_bytes[doc_id] = self._log_bytes.get(doc_id, 0) + len(line)
+        self._log_pending.add(doc_id)
+        self._states[doc_id] = state
+
+    def _flush_log(self, doc_id: str) -> None:
+        self._log_pending.discard(doc_id)
+        handle = self._log_handles.get(doc_id)
+        if handle is None:
+            return
+        handle.flush()
+        if _fsync_due(self._last_fsync_ts, doc_id):
+            os.fsync(handle.fileno())
+            _request_dir_sync()
+
+    def _truncate_log(self, doc_id: str) -> None:
+        self._log_pending.discard(doc_id)
+        handle = self._log_handles.pop(doc_id, None)
+        if handle is not None:
+            handle.close()
+        self._log_path(doc_id).unlink(missing_ok=True)
+        self._log_bytes.pop(doc_id, None)
+
+    def _write_state(self, doc_id: str, state: DocState) -> None:
         payload = {
             "tokens": state.tokens,
-            "votes": state.votes,
+            "votesByClient": _votes_to_runs(state.votes_by_client),
             "updated": state.updated,
             "sourceName": state.source_name,
+            "logSeq": state.log_seq,
         }
         path = self._state_path(doc_id)
-        tmp_file = None
-        try:
-            with NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=DATA_DIR) as tmp:
-                json.dump(payload, tmp, ensure_ascii=False)
-                tmp.flush()
-                os.fsync(tmp.fileno())
-                tmp_file = Path(tmp.name)
-            os.replace(tmp_file, path)
-        finally:
-            if tmp_file and tmp_file.exists():
-                tmp_file.unlink(missing_ok=True)
+        _atomic_write_json(path, payload, fsync=_fsync_due(self._last_fsync_ts, doc_id))
         self._states[doc_id] = state
+        # Every logged event is now covered by the snapshot's logSeq.
+        self._truncate_log(doc_id)
 
     async def ensure_tokens(self, doc_id: str, source_name: Optional[str]) -> DocState:
         async with self._doc_lock(doc_id):
@@ -149,9 +475,11 @@ class DocumentStore:
         resolved_name = self._resolve_source_name(state, source_name)
         tokens, resolved = self._tokenize_from_source(resolved_name)
         state.tokens = tokens
+        state.break_mask = break_mask(tokens)
+        state.version += 1
         state.source_name = resolved
         state.updated = state.updated or time.time()
-        self._ensure_votes_length(state)
+        self._trim_votes(state)
         await self.save_state(doc_id, state)
         return state
 
@@ -161,7 +489,9 @@ class DocumentStore:
         async with self._doc_lock(doc_id):
             state = await self.get_state(doc_id)
             state.tokens = tokens
-            state.votes = [dict() for _ in range(len(tokens))]
+            state.break_mask = break_mask(tokens)
+            state.votes_by_client = {}
+            state.version += 1
             state.updated = time.time()
             state.source_name = resolved
             await self.save_state(doc_id, state)
@@ -170,9 +500,9 @@ class DocumentStore:
     async def clear_votes(self, doc_id: str) -> DocState:
         async with self._doc_lock(doc_id):
             state = await self._ensure_tokens_locked(doc_id, None)
-            state.votes = [dict() for _ in range(len(state.tokens))]
+            state.votes_by_client = {}
             state.updated = time.time()
-            await self.save_state(doc_id, state)
+            self._append_event(doc_id, state, {"t": "clr"})
             return state
 
     async def apply_highlight(
@@ -195,20 +525,12 @@ class DocumentStore:
             end = max(0, min(end, n - 1))
             if start > end:
                 start, end = end, start
-            self._ensure_votes_length(state)
-            changed = False
-            for idx in range(start, end + 1):
-                bucket = state.votes[idx]
-                if color:
-                    if bucket.get(client_id) != color:
-                        bucket[client_id] = color
-                        changed = True
-                else:
-                    if bucket.pop(client_id, None) is not None:
-                        changed = True
+            changed = self._apply_range(state, client_id, start, end, color)
             if changed:
                 state.updated = timestamp or time.time()
-                await self.save_state(doc_id, state)
+                self._append_event(
+                    doc_id, state, {"t": "hl", "c": client_id, "s": start, "e": end, "col": color}
+                )
             return changed
 
     async def clear_client(self, doc_id: str, client_id: str, timestamp: Optional[float]) -> bool:
@@ -216,47 +538,101 @@ class DocumentStore:
             return False
         async with self._doc_lock(doc_id):
             state = await self._ensure_tokens_locked(doc_id, None)
-            changed = False
-            for bucket in state.votes:
-                if bucket.pop(client_id, None) is not None:
-                    changed = True
+            changed = self._clear_client_votes(state, client_id)
             if changed:
                 state.updated = timestamp or time.time()
-                await self.save_state(doc_id, state)
+                self._append_event(doc_id, state, {"t": "cc", "c": client_id})
             return changed
 
+    def _apply_range(self, state: DocState, client_id: str, start: int, end: int, color: str) -> bool:
+        changed = False
+        if color:
+            # Interned so the run and tie-break loops compare colors by identity.
+            if isinstance(color, str):
+                color = sys.intern(color)
+            bucket = state.votes_by_client.setdefault(sys.intern(client_id), {})
+            for idx in range(start, end + 1):
+                if bucket.get(idx) != color:
+                    bucket[idx] = color
+                    changed = True
+            return changed
+        bucket = state.votes_by_client.get(client_id)
+        if not bucket:
+            return False
+        for idx in range(start, end + 1):
+            if bucket.pop(idx, None) is not None:
+                changed = True
+        if not bucket:
+            del state.votes_by_client[client_id]
+        return changed
+
+    def _clear_client_votes(self, state: DocState, client_id: str) -> bool:
+        return bool(state.votes_by_client.pop(client_id, None))
+
+    async def flush(self, compact: bool = False) -> None:
+        """Push buffered log appends to disk and snapshot logs past LOG_COMPACT_BYTES."""
+        for doc_id in list(self._log_handles):
+            async with self._doc_lock(doc_id):
+                try:
+                    if doc_id in self._log_pending:
+                        self._flush_log(doc_id)
+                    oversized = self._log_bytes.get(doc_id, 0) >= LOG_COMPACT_BYTES
+                    state = self._states.get(doc_id)
+                    if state is not None and (compact or oversized):
+                        self._write_state(doc_id, state)
+                except Exception as exc:
+                    LOGGER.error("Failed to flush %s: %s", doc_id, exc)
+
     def set_locked(self, doc_id: str, value: bool) -> None:
-        self._lock_flags[doc_id] = value
+        self._lock_flags[doc_id] = bool(value)
 
     def is_locked(self, doc_id: str) -> bool:
-        return bool(self._lock_flags.get(doc_id, False))
+        return self._lock_flags.get(doc_id) is True
 
     def register_ws(self, doc_id: str, websocket: WebSocket) -> None:
         self._ws_connections.setdefault(doc_id, set()).add(websocket)
 
     def unregister_ws(self, doc_id: str, websocket: WebSocket) -> None:
+        self._drop_sockets(doc_id, (websocket,))
+
+    def _drop_sockets(self, doc_id: str, sockets: Iterable[WebSocket]) -> None:
         conns = self._ws_connections.get(doc_id)
         if not conns:
             return
-        conns.discard(websocket)
+        conns.difference_update(sockets)
         if not conns:
             self._ws_connections.pop(doc_id, None)
+            self._updated_frames.pop(doc_id, None)
 
     async def broadcast(self, doc_id: str, message: Dict) -> None:
-        if doc_id not in self._ws_connections:
+        conns = self._ws_connections.get(doc_id)
+        if not conns:
             return
-        payload = json.dumps(message, ensure_ascii=False)
-        dead: List[WebSocket] = []
-        for ws in list(self._ws_connections[doc_id]):
-            try:
-                await ws.send_text(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.unregister_ws(doc_id, ws)
+        await self._send_frame(doc_id, conns, _text_frame(message))
+
+    async def broadcast_updated(self, doc_id: str) -> None:
+        """Tell subscribers of *doc_id* to refetch; the frame never changes, so it is cached."""
+        conns = self._ws_connections.get(doc_id)
+        if not conns:
+            return
+        frame = self._updated_frames.get(doc_id)
+        if frame is None:
+            frame = _text_frame({"type": "state_updated", "docId": doc_id})
+            self._updated_frames[doc_id] = frame
+        await self._send_frame(doc_id, conns, frame)
+
+    async def _send_frame(self, doc_id: str, conns: Set[WebSocket], frame: Dict[str, str]) -> None:
+        dead = await _fan_out(tuple(conns), frame)
+        if dead:
+            self._drop_sockets(doc_id, dead)
 
     def _tokenize_from_source(self, source_name: str) -> tuple[List[str], str]:
-        text = _strip_bom(self.read_source_text(source_name))
+        path = self._source_path(source_name)
+        st = path.stat()
+        cached = self._src_cache.get(source_name)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return list(cached[2]), source_name
+        text = self._read_path(path)
         is_md = is_markdown_name(source_name)
         html_like = is_md or source_name.lower().endswith(".html")
         if is_md:
@@ -267,7 +643,8 @@ class DocumentStore:
             tokens = tokenize(text)
         if html_like:
             tokens = [tok for tok in tokens if tok and tok != "\n"]
-        return tokens, source_name
+        self._src_cache[source_name] = (st.st_size, st.st_mtime_ns, tokens)
+        return list(tokens), source_name
 
     def _resolve_source_name(self, state: DocState, override: Optional[str]) -> str:
         if override:
@@ -277,35 +654,46 @@ class DocumentStore:
         return DEFAULT_SOURCE_NAME
 
     def read_source_text(self, source_name: Optional[str]) -> str:
+        return self._read_path(self._source_path(source_name))
+
+    def _source_path(self, source_name: Optional[str]) -> Path:
         name = self._sanitize_source_name(source_name) or DEFAULT_SOURCE_NAME
         path = WWWDOCS_DIR / name
         if not path.is_file():
             raise HTTPException(status_code=404, detail=f"Source '{name}' not found")
+        return path
+
+    def _read_path(self, path: Path) -> str:
+        # utf-8-sig drops a leading BOM while decoding; _strip_bom only scans for stray ones.
         try:
-            return _strip_bom(path.read_text(encoding="utf-8"))
+            return _strip_bom(path.read_text(encoding="utf-8-sig"))
         except UnicodeDecodeError:
-            return _strip_bom(path.read_text(encoding="utf-8", errors="ignore"))
+            return _strip_bom(path.read_text(encoding="utf-8-sig", errors="ignore"))
 
     def _sanitize_source_name(self, name: Optional[str]) -> str:
         if not name:
             return DEFAULT_SOURCE_NAME
-        return Path(name).name
-
-    def _ensure_votes_length(self, state: DocState) -> None:
-        target = len(state.tokens)
-        votes = state.votes
-        if len(votes) < target:
-            votes.extend({} for _ in range(target - len(votes)))
-        elif len(votes) > target:
-            del votes[target:]
+        # Basename across both separators without building a PurePath per call.
+        return name.rsplit("/", 1)[-1].rsplit("\\", 1)[-1] or DEFAULT_SOURCE_NAME
+
+    def _trim_votes(self, state: DocState) -> None:
+        """Drop votes that point past the end of the token list."""
+        n = len(state.tokens)
+        for client_id, bucket in list(state.votes_by_client.items()):
+            stale = [idx for idx in bucket if idx >= n]
+            for idx in stale:
+                del bucket[idx]
+            if not bucket:
+                del state.votes_by_client[client_id]
 
     def list_document_ids(self) -> List[str]:
+        mtime = DATA_DIR.stat().st_mtime_ns
+        if self._id_cache is None or mtime != self._id_cache_mtime:
+            self._id_cache = _scan_data_ids("state_")
+            self._id_cache_mtime = mtime
         doc_ids = set(self._states.keys())
         doc_ids.add(DEFAULT_DOC_ID)
-        for path in DATA_DIR.glob("state_*.json"):
-            stem = path.stem
-            if stem.startswith("state_"):
-                doc_ids.add(stem[6:])
+        doc_ids.update(self._id_cache)
         return sorted(doc_ids)
 
 
@@ -319,8 +707,10 @@ class FormState:
     cooldown: float = 0.0
     allow_repeat: bool = True
     locked: bool = False
-    responses: List[Dict[str, Any]] = field(default_factory=list)
+    responses: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=MAX_FORM_RESPONSES))
     last_by_client: Dict[str, float] = field(default_factory=dict)
+    # clientId -> number of its responses still held in ``responses``.
+    client_counts: Counter = field(default_factory=Counter)
     next_seq: int = 1
     updated: Optional[float] = None
 
@@ -336,17 +726,17 @@ class FormError(Exception):
 class FormManager:
     def __init__(self) -> None:
         self._states: Dict[str, FormState] = {}
-        self._locks: Dict[str, asyncio.Lock] = {}
+        self._locks = _LockPool()
+        self._last_fsync_ts: Dict[str, float] = {}
+        self._dirty: Dict[str, FormState] = {}
+        self._id_cache: Optional[List[str]] = None
+        self._id_cache_mtime: int = 0
 
     def _path(self, form_id: str) -> Path:
         return DATA_DIR / f"form_{form_id}.json"
 
     def _lock(self, form_id: str) -> asyncio.Lock:
-        lock = self._locks.get(form_id)
-        if lock is None:
-            lock = asyncio.Lock()
-            self._locks[form_id] = lock
-        return lock
+        return self._locks[form_id]
 
     def _default_state(self, form_id: str) -> FormState:
         state = FormState(form_id=form_id)
@@ -365,8 +755,7 @@ class FormManager:
         if not path.exists():
             return self._default_state(form_id)
         try:
-            with path.open("r", encoding="utf-8") as handle:
-                raw = json.load(handle)
+            raw = _load_state_file(path.read_bytes())
         except Exception as exc:
             LOGGER.error("Failed to load form %s: %s", form_id, exc)
             return self._default_state(form_id)
@@ -375,45 +764,45 @@ class FormManager:
         state.cooldown = float(raw.get("cooldown") or 0.0)
         state.allow_repeat = bool(raw.get("allowRepeat", True))
         state.locked = bool(raw.get("locked", False))
+        # The decoder hands us fresh objects, so store them without copying.
         responses = raw.get("responses") or []
-        state.responses = [dict(item) for item in responses]
-        for idx, item in enumerate(state.responses, start=1):
+        for idx, item in enumerate(responses, start=1):
             item.setdefault("seq", idx)
-        state.next_seq = int(raw.get("nextSeq") or (len(state.responses) + 1))
+        state.responses = deque(responses, maxlen=MAX_FORM_RESPONSES)
+        state.client_counts = Counter(item.get("clientId") for item in state.responses)
+        state.next_seq = int(raw.get("nextSeq") or (len(responses) + 1))
         state.last_by_client = {k: float(v) for k, v in (raw.get("lastByClient") or {}).items()}
         state.updated = raw.get("updated")
         return state
 
     async def _save_state(self, form_id: str, state: FormState) -> None:
+        self._dirty.pop(form_id, None)
+        self._write_state(form_id, state)
+
+    def _mark_dirty(self, form_id: str, state: FormState) -> None:
+        self._states[form_id] = state
+        self._dirty[form_id] = state
+
+    def _write_state(self, form_id: str, state: FormState) -> None:
         payload = {
             "formId": form_id,
             "question": state.question,
             "cooldown": state.cooldown,
             "allowRepeat": state.allow_repeat,
             "locked": state.locked,
-            "responses": state.responses,
+            "responses": list(state.responses),
             "lastByClient": state.last_by_client,
             "nextSeq": state.next_seq,
             "updated": state.updated,
         }
         path = self._path(form_id)
-        tmp_file: Optional[Path] = None
-        try:
-            with NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=DATA_DIR) as tmp:
-                json.dump(payload, tmp, ensure_ascii=False)
-                tmp.flush()
-                os.fsync(tmp.fileno())
-                tmp_file = Path(tmp.name)
-            os.replace(tmp_file, path)
-        finally:
-            if tmp_file and tmp_file.exists():
-                tmp_file.unlink(missing_ok=True)
+        _atomic_write_json(path, payload, fsync=_fsync_due(self._last_fsync_ts, form_id))
         self._states[form_id] = state
 
     async def get_config(self, form_id: str) -> Dict[str, Any]:
-        async with self._lock(form_id):
-            state = self._ensure_loaded(form_id)
-            return self._config_snapshot(state)
+        # Read paths never await, so they cannot interleave with a writer; no lock needed.
+        state = self._ensure_loaded(form_id)
+        return self._config_snapshot(state)
 
     def _config_snapshot(self, state: FormState) -> Dict[str, Any]:
         return {
@@ -475,10 +864,8 @@ class FormManager:
                         status=429,
                         payload={"retry_in": max(0.0, state.cooldown - delta)},
                     )
-            if not state.allow_repeat:
-                for item in state.responses:
-                    if item.get("clientId") == client_id:
-                        raise FormError("repeat_not_allowed", "Repeat submissions are disabled", status=409)
+            if not state.allow_repeat and client_id in state.client_counts:
+                raise FormError("repeat_not_allowed", "Repeat submissions are disabled", status=409)
             seq = state.next_seq
             record = {
                 "seq": seq,
@@ -487,49 +874,58 @@ class FormManager:
                 "question": state.question,
                 "submitted": now,
             }
+            if len(state.responses) == state.responses.maxlen:
+                # The oldest response is about to fall out of the log.
+                evicted = state.responses[0].get("clientId")
+                state.client_counts[evicted] -= 1
+                if state.client_counts[evicted] <= 0:
+                    del state.client_counts[evicted]
             state.responses.append(record)
-            if len(state.responses) > MAX_FORM_RESPONSES:
-                state.responses = state.responses[-MAX_FORM_RESPONSES:]
+            state.client_counts[client_id] += 1
             state.last_by_client[client_id] = now
             state.next_seq = seq + 1
             state.updated = now
-            await self._save_state(form_id, state)
+            self._mark_dirty(form_id, state)
             return record
 
     async def results(self, form_id: str, since: Optional[int] = None) -> Dict[str, Any]:
-        async with self._lock(form_id):
-            state = self._ensure_loaded(form_id)
-            if since is None:
-                items = [dict(item) for item in state.responses]
-            else:
-                items = [dict(item) for item in state.responses if item.get("seq", 0) > since]
-            return {
-                "formId": form_id,
-                "results": items,
-                "nextSeq": state.next_seq,
-                "updated": state.updated,
-                "cooldown": state.cooldown,
-                "allowRepeat": state.allow_repeat,
-                "locked": state.locked,
-            }
+        state = self._ensure_loaded(form_id)
+        if since is None:
+            items = list(state.responses)
+        else:
+            items = _items_since(state.responses, since)
+        return {
+            "formId": form_id,
+            "results": items,
+            "nextSeq": state.next_seq,
+            "updated": state.updated,
+            "cooldown": state.cooldown,
+            "allowRepeat": state.allow_repeat,
+            "locked": state.locked,
+        }
 
     async def clear(self, form_id: str) -> Dict[str, Any]:
         async with self._lock(form_id):
             state = self._ensure_loaded(form_id)
             state.responses.clear()
+            state.client_counts.clear()
             state.last_by_client.clear()
             state.next_seq = 1
             state.updated = time.time()
             await self._save_state(form_id, state)
             return self._config_snapshot(state)
 
+    async def flush(self) -> None:
+        await _flush_dirty(self._dirty, self._lock, self._write_state)
+
     def list_form_ids(self) -> List[str]:
+        mtime = DATA_DIR.stat().st_mtime_ns
+        if self._id_cache is None or mtime != self._id_cache_mtime:
+            self._id_cache = _scan_data_ids("form_")
+            self._id_cache_mtime = mtime
         form_ids = set(self._states.keys())
         form_ids.add(DEFAULT_FORM_ID)
-        for path in DATA_DIR.glob("form_*.json"):
-            stem = path.stem
-            if stem.startswith("form_"):
-                form_ids.add(stem[5:])
+        form_ids.update(self._id_cache)
         return sorted(form_ids)
 
 
@@ -546,6 +942,7 @@ class AgreementManager:
         self._state: Optional[AgreementState] = None
         self._lock = asyncio.Lock()
         self._path = DATA_DIR / "agreement_state.json"
+        self._last_fsync_ts: Dict[str, float] = {}
 
     def _ensure_loaded(self) -> AgreementState:
         state = self._state
@@ -559,8 +956,8 @@ class AgreementManager:
         if not path.exists():
             return AgreementState()
         try:
-            with path.open("r", encoding="utf-8") as handle:
-                raw = json.load(handle)
+            # Stdlib json keeps client meta ints wider than 64 bits exact; orjson turns them into floats.
+            raw = json.loads(path.read_bytes())
         except Exception as exc:
             LOGGER.error("Failed to load agreement state: %s", exc)
             return AgreementState()
@@ -607,17 +1004,7 @@ class AgreementManager:
                 key=lambda item: item.get("seq", 0),
             ),
         }
-        tmp_file: Optional[Path] = None
-        try:
-            with NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=DATA_DIR) as tmp:
-                json.dump(payload, tmp, ensure_ascii=False)
-                tmp.flush()
-                os.fsync(tmp.fileno())
-                tmp_file = Path(tmp.name)
-            os.replace(tmp_file, self._path)
-        finally:
-            if tmp_file and tmp_file.exists():
-                tmp_file.unlink(missing_ok=True)
+        _atomic_write_json(self._path, payload, fsync=_fsync_due(self._last_fsync_ts, "agreement"))
         self._state = state
 
     def _sanitize_meta(self, meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
@@ -676,45 +1063,42 @@ class AgreementManager:
             }
 
     async def summary(self) -> Dict[str, Any]:
-        async with self._lock:
-            state = self._ensure_loaded()
-            return {
-                "revision": state.revision,
-                "totalAccepted": len(state.accepted),
-                "updated": state.updated,
-            }
+        state = self._ensure_loaded()
+        return {
+            "revision": state.revision,
+            "totalAccepted": len(state.accepted),
+            "updated": state.updated,
+        }
 
     async def status(self, client_id: str) -> Dict[str, Any]:
         normalized = client_id.strip()[:128]
-        async with self._lock:
-            state = self._ensure_loaded()
-            record = state.accepted.get(normalized)
-            return {
-                "revision": state.revision,
-                "accepted": record is not None,
-                "acceptedAt": record.get("accepted") if record else None,
-                "acceptedIso": record.get("accepted_iso") if record else None,
-                "totalAccepted": len(state.accepted),
-                "updated": state.updated,
-            }
+        state = self._ensure_loaded()
+        record = state.accepted.get(normalized)
+        return {
+            "revision": state.revision,
+            "accepted": record is not None,
+            "acceptedAt": record.get("accepted") if record else None,
+            "acceptedIso": record.get("accepted_iso") if record else None,
+            "totalAccepted": len(state.accepted),
+            "updated": state.updated,
+        }
 
     async def records(self) -> Dict[str, Any]:
-        async with self._lock:
-            state = self._ensure_loaded()
-            records = sorted(state.accepted.values(), key=lambda item: item.get("seq", 0))
-            return {
-                "revision": state.revision,
-                "totalAccepted": len(records),
-                "updated": state.updated,
-                "records": [dict(item) for item in records],
-            }
+        state = self._ensure_loaded()
+        records = sorted(state.accepted.values(), key=lambda item: item.get("seq", 0))
+        return {
+            "revision": state.revision,
+            "totalAccepted": len(records),
+            "updated": state.updated,
+            "records": records,
+        }
 
 
 @dataclass
 class ButtonPanelState:
     panel_id: str
     buttons: Dict[str, Dict[str, Any]] = field(default_factory=dict)
-    events: List[Dict[str, Any]] = field(default_factory=list)
+    events: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=MAX_BUTTON_EVENTS))
     locked: bool = False
     cooldown: float = 0.0
     last_by_client: Dict[str, float] = field(default_factory=dict)
@@ -733,23 +1117,20 @@ class ButtonError(Exception):
 class ButtonManager:
     def __init__(self) -> None:
         self._states: Dict[str, ButtonPanelState] = {}
-        self._locks: Dict[str, asyncio.Lock] = {}
+        self._locks = _LockPool()
+        self._last_fsync_ts: Dict[str, float] = {}
+        self._dirty: Dict[str, ButtonPanelState] = {}
+        self._id_cache: Optional[List[str]] = None
+        self._id_cache_mtime: int = 0
 
     def _path(self, panel_id: str) -> Path:
         return DATA_DIR / f"buttons_{panel_id}.json"
 
     def _lock(self, panel_id: str) -> asyncio.Lock:
-        lock = self._locks.get(panel_id)
-        if lock is None:
-            lock = asyncio.Lock()
-            self._locks[panel_id] = lock
-        return lock
+        return self._locks[panel_id]
 
     def _default_buttons(self) -> Dict[str, Dict[str, Any]]:
-        return {
-            item["id"]: {"label": item["label"], "minus": 0, "plus": 0}
-            for item in BUTTON_DEFINITIONS
-        }
+        return {button_id: info.copy() for button_id, info in _DEFAULT_BUTTON_TEMPLATE.items()}
 
     def _default_state(self, panel_id: str) -> ButtonPanelState:
         state = ButtonPanelState(panel_id=panel_id)
@@ -768,8 +1149,7 @@ class ButtonManager:
         if not path.exists():
             return self._default_state(panel_id)
         try:
-            with path.open("r", encoding="utf-8") as handle:
-                raw = json.load(handle)
+            raw = _load_state_file(path.read_bytes())
         except Exception as exc:
             LOGGER.error("Failed to load buttons %s: %s", panel_id, exc)
             return self._default_state(panel_id)
@@ -786,19 +1166,28 @@ class ButtonManager:
             entry["plus"] = int(info.get("plus", 0))
         state.locked = bool(raw.get("locked", False))
         state.cooldown = float(raw.get("cooldown") or 0.0)
-        state.events = [dict(item) for item in (raw.get("events") or [])]
-        for idx, item in enumerate(state.events, start=1):
+        events = raw.get("events") or []
+        for idx, item in enumerate(events, start=1):
             item.setdefault("seq", idx)
-        state.next_seq = int(raw.get("nextSeq") or (len(state.events) + 1))
+        state.events = deque(events, maxlen=MAX_BUTTON_EVENTS)
+        state.next_seq = int(raw.get("nextSeq") or (len(events) + 1))
         state.last_by_client = {k: float(v) for k, v in (raw.get("lastByClient") or {}).items()}
         state.updated = raw.get("updated")
         return state
 
     async def _save_state(self, panel_id: str, state: ButtonPanelState) -> None:
+        self._dirty.pop(panel_id, None)
+        self._write_state(panel_id, state)
+
+    def _mark_dirty(self, panel_id: str, state: ButtonPanelState) -> None:
+        self._states[panel_id] = state
+        self._dirty[panel_id] = state
+
+    def _write_state(self, panel_id: str, state: ButtonPanelState) -> None:
         payload = {
             "panelId": panel_id,
             "buttons": state.buttons,
-            "events": state.events,
+            "events": list(state.events),
             "locked": state.locked,
             "cooldown": state.cooldown,
             "lastByClient": state.last_by_client,
@@ -806,23 +1195,12 @@ class ButtonManager:
             "updated": state.updated,
         }
         path = self._path(panel_id)
-        tmp_file: Optional[Path] = None
-        try:
-            with NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=DATA_DIR) as tmp:
-                json.dump(payload, tmp, ensure_ascii=False)
-                tmp.flush()
-                os.fsync(tmp.fileno())
-                tmp_file = Path(tmp.name)
-            os.replace(tmp_file, path)
-        finally:
-            if tmp_file and tmp_file.exists():
-                tmp_file.unlink(missing_ok=True)
+        _atomic_write_json(path, payload, fsync=_fsync_due(self._last_fsync_ts, panel_id))
         self._states[panel_id] = state
 
     async def get_config(self, panel_id: str) -> Dict[str, Any]:
-        async with self._lock(panel_id):
-            state = self._ensure_loaded(panel_id)
-            return self._config_snapshot(panel_id, state)
+        state = self._ensure_loaded(panel_id)
+        return self._config_snapshot(panel_id, state)
 
     def _config_snapshot(self, panel_id: str, state: ButtonPanelState) -> Dict[str, Any]:
         buttons = [
@@ -834,8 +1212,7 @@ class ButtonManager:
             }
             for button_id, info in state.buttons.items()
         ]
-        order = {bid: idx for idx, bid in enumerate(DEFAULT_BUTTON_SEQUENCE)}
-        buttons.sort(key=lambda item: order.get(item["id"], len(order)))
+        buttons.sort(key=lambda item: _BUTTON_ORDER.get(item["id"], len(_BUTTON_ORDER)))
         return {
             "panelId": panel_id,
             "buttons": buttons,
@@ -901,38 +1278,35 @@ class ButtonManager:
                 "timestamp": now,
             }
             state.events.append(event)
-            if len(state.events) > MAX_BUTTON_EVENTS:
-                state.events = state.events[-MAX_BUTTON_EVENTS:]
             state.last_by_client[client_id] = now
             state.next_seq = seq + 1
             state.updated = now
-            await self._save_state(panel_id, state)
+            self._mark_dirty(panel_id, state)
             return event
 
     async def state(self, panel_id: str, since: Optional[int] = None) -> Dict[str, Any]:
-        async with self._lock(panel_id):
-            state = self._ensure_loaded(panel_id)
-            buttons = {
-                button_id: {
-                    "label": info["label"],
-                    "minus": info["minus"],
-                    "plus": info["plus"],
-                }
-                for button_id, info in state.buttons.items()
-            }
-            if since is None:
-                events = [dict(item) for item in state.events]
-            else:
-                events = [dict(item) for item in state.events if item.get("seq", 0) > since]
-            return {
-                "panelId": panel_id,
-                "buttons": buttons,
-                "events": events,
-                "nextSeq": state.next_seq,
-                "locked": state.locked,
-                "cooldown": state.cooldown,
-                "updated": state.updated,
+        state = self._ensure_loaded(panel_id)
+        buttons = {
+            button_id: {
+                "label": info["label"],
+                "minus": info["minus"],
+                "plus": info["plus"],
             }
+            for button_id, info in state.buttons.items()
+        }
+        if since is None:
+            events = list(state.events)
+        else:
+            events = _items_since(state.events, since)
+        return {
+            "panelId": panel_id,
+            "buttons": buttons,
+            "events": events,
+            "nextSeq": state.next_seq,
+            "locked": state.locked,
+            "cooldown": state.cooldown,
+            "updated": state.updated,
+        }
 
     async def reset(self, panel_id: str) -> Dict[str, Any]:
         async with self._lock(panel_id):
@@ -947,13 +1321,17 @@ class ButtonManager:
             await self._save_state(panel_id, state)
             return self._config_snapshot(panel_id, state)
 
+    async def flush(self) -> None:
+        await _flush_dirty(self._dirty, self._lock, self._write_state)
+
     def list_panel_ids(self) -> List[str]:
+        mtime = DATA_DIR.stat().st_mtime_ns
+        if self._id_cache is None or mtime != self._id_cache_mtime:
+            self._id_cache = _scan_data_ids("buttons_")
+            self._id_cache_mtime = mtime
         panel_ids = set(self._states.keys())
         panel_ids.add(DEFAULT_BUTTON_PANEL)
-        for path in DATA_DIR.glob("buttons_*.json"):
-            stem = path.stem
-            if stem.startswith("buttons_"):
-                panel_ids.add(stem[8:])
+        panel_ids.update(self._id_cache)
         return sorted(panel_ids)
 
 
@@ -966,6 +1344,7 @@ class NavigationHub:
     def __init__(self) -> None:
         self._groups: Dict[str, Set[WebSocket]] = {}
         self._assignments: Dict[WebSocket, str] = {}
+        self._all_sockets: Set[WebSocket] = set()
         self._lock = asyncio.Lock()
         self._last_command: Optional[Dict[str, Any]] = None
         self._default_target: Optional[str] = None
@@ -975,39 +1354,40 @@ class NavigationHub:
             group = group or "all"
             self._groups.setdefault(group, set()).add(ws)
             self._assignments[ws] = group
+            self._all_sockets.add(ws)
 
     async def unregister(self, ws: WebSocket) -> None:
         async with self._lock:
-            group = self._assignments.pop(ws, None)
-            if group:
-                group_set = self._groups.get(group)
-                if group_set:
-                    group_set.discard(ws)
-                    if not group_set:
-                        self._groups.pop(group, None)
+            self._remove(ws)
+
+    def _remove(self, ws: WebSocket) -> None:
+        self._all_sockets.discard(ws)
+        group = self._assignments.pop(ws, None)
+        if group:
+            group_set = self._groups.get(group)
+            if group_set:
+                group_set.discard(ws)
+                if not group_set:
+                    self._groups.pop(group, None)
 
     async def broadcast(self, group: str, message: Dict[str, Any]) -> None:
-        data = json.dumps(message, ensure_ascii=False)
+        frame = _text_frame(message)
         async with self._lock:
             if group == "all" or not group:
-                targets = set()
-                for sockets in self._groups.values():
-                    targets.update(sockets)
+                targets = tuple(self._all_sockets)
             else:
-                targets = set(self._groups.get(group, set()))
+                targets = tuple(self._groups.get(group, ()))
             self._last_command = {
                 "group": group or "all",
                 "message": message,
                 "ts": time.time(),
             }
-        dead: List[WebSocket] = []
-        for ws in targets:
-            try:
-                await ws.send_text(data)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            await self.unregister(ws)
+        # Send outside the lock; drop every failed socket under a single acquisition.
+        dead = await _fan_out(targets, frame)
+        if dead:
+            async with self._lock:
+                for ws in dead:
+                    self._remove(ws)
 
     async def status(self) -> Dict[str, Any]:
         async with self._lock:
@@ -1089,8 +1469,33 @@ def list_sources() -> List[str]:
             files.append(path.name)
     return files
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    flusher = asyncio.create_task(_run_flusher([store.flush, forms_store.flush, buttons_store.flush]))
+    try:
+        yield
+    finally:
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+        await store.flush(compact=True)
+        await forms_store.flush()
+        await buttons_store.flush()
+        _sync_data_dir()
+
+
 root_path = (os.getenv("BASE_PATH") or "").rstrip("/")
-app = FastAPI(title="Highlight Local Server", root_path=root_path or "")
+app = FastAPI(
+    title="Highlight Local Server",
+    root_path=root_path or "",
+    lifespan=lifespan,
+    default_response_class=JSON_RESPONSE_CLASS,
+)
+# Only clients that send Accept-Encoding: gzip get compressed bodies.
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=5)
 app.mount("/docs", StaticFiles(directory=PUBLIC_DIR, html=True), name="docs")
 
 
@@ -1104,7 +1509,7 @@ def sanitize_doc_id(raw: Optional[str]) -> str:
 def sanitize_form_id(raw: Optional[str]) -> str:
     form_id = (raw or DEFAULT_FORM_ID).strip()
     if not FORM_ID_RE.fullmatch(form_id):
-        cleaned = re.sub(r"[^A-Za-z0-9_.-]", "", form_id)[:64]
+        cleaned = _ID_INVALID_CHARS.sub("", form_id)[:64]
         form_id = cleaned or DEFAULT_FORM_ID
     return form_id
 
@@ -1112,7 +1517,7 @@ def sanitize_form_id(raw: Optional[str]) -> str:
 def sanitize_panel_id(raw: Optional[str]) -> str:
     panel_id = (raw or DEFAULT_BUTTON_PANEL).strip()
     if not PANEL_ID_RE.fullmatch(panel_id):
-        cleaned = re.sub(r"[^A-Za-z0-9_.-]", "", panel_id)[:64]
+        cleaned = _ID_INVALID_CHARS.sub("", panel_id)[:64]
         panel_id = cleaned or DEFAULT_BUTTON_PANEL
     return panel_id
 
@@ -1127,37 +1532,119 @@ def _strip_bom(text: str) -> str:
     return text
 
 
-def top_color_at(bucket: Dict[str, str]) -> str:
-    counts: Dict[str, int] = {}
-    for color in bucket.values():
-        if not color:
+def _votes_from_token_list(entries: List[Dict[str, str]]) -> Dict[str, Dict[int, str]]:
+    """Convert the legacy per-token ``[{clientId: color}, ...]`` layout."""
+    votes: Dict[str, Dict[int, str]] = {}
+    for idx, entry in enumerate(entries):
+        for client_id, color in (entry or {}).items():
+            if color:
+                votes.setdefault(client_id, {})[idx] = color
+    return votes
+
+
+def votes_per_token(votes: Dict[str, Dict[int, str]], n: int) -> List[Dict[str, str]]:
+    """Materialize the per-token ``[{clientId: color}, ...]`` view used by exports."""
+    per_token: List[Dict[str, str]] = [{} for _ in range(n)]
+    for client_id, bucket in votes.items():
+        for idx, color in bucket.items():
+            if idx < n:
+                per_token[idx][client_id] = color
+    return per_token
+
+
+def _votes_to_runs(votes: Dict[str, Dict[int, str]]) -> Dict[str, List[List[Any]]]:
+    """Pack each client's votes into ``[start, end, color]`` runs for the snapshot."""
+    packed: Dict[str, List[List[Any]]] = {}
+    for client_id, bucket in votes.items():
+        runs = [list(run) for run in _color_runs(sorted(bucket.items()))]
+        if runs:
+            packed[client_id] = runs
+    return packed
+
+
+def _votes_from_runs(packed: Dict[str, List[List[Any]]]) -> Dict[str, Dict[int, str]]:
+    votes: Dict[str, Dict[int, str]] = {}
+    for client_id, runs in packed.items():
+        bucket: Dict[int, str] = {}
+        for start, end, color in runs:
+            if color:
+                if isinstance(color, str):
+                    color = sys.intern(color)
+                for idx in range(int(start), int(end) + 1):
+                    bucket[idx] = color
+        if bucket:
+            votes[client_id] = bucket
+    return votes
+
+
+def _color_runs(pairs: Iterable[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
+    """Collapse index-sorted ``(idx, color)`` pairs into ``(start, end, color)`` runs.
+
+    A run ends at a color change or a gap in the indices; empty colors are dropped.
+    """
+    runs: List[Tuple[int, int, str]] = []
+    append = runs.append
+    start = end = -2
+    current = ""
+    for idx, color in pairs:
+        if idx == end + 1 and color == current:
+            end = idx
             continue
-        counts[color] = counts.get(color, 0) + 1
+        if current:
+            append((start, end, current))
+        start = end = idx
+        current = color
+    if current:
+        append((start, end, current))
+    return runs
+
+
+def break_mask(tokens: List[str]) -> bytes:
+    return bytes(map(is_break_token, tokens))
+
+
+def _client_runs(mask: bytes, bucket: Dict[int, str]) -> List[Tuple[int, int, str]]:
+    """Runs of one client's votes, split at break tokens."""
+    limit = len(mask)
+    return _color_runs(
+        (idx, color) for idx, color in sorted(bucket.items()) if idx < limit and not mask[idx]
+    )
+
+
+def _token_buckets(votes: Dict[str, Dict[int, str]]) -> Dict[int, Dict[str, str]]:
+    """Invert client -> token votes into token -> {client: color} for voted tokens only."""
+    buckets: Dict[int, Dict[str, str]] = {}
+    for client_id, bucket in votes.items():
+        for idx, color in bucket.items():
+            entry = buckets.get(idx)
+            if entry is None:
+                buckets[idx] = {client_id: color}
+            else:
+                entry[client_id] = color
+    return buckets
+
+
+def top_color_at(bucket: Dict[str, str]) -> str:
+    if len(bucket) == 1:
+        # Most marked tokens carry a single vote.
+        for color in bucket.values():
+            return color
+    # Ties go to the color seen first in *bucket*. Buckets from _token_buckets follow the
+    # document's client order (first vote anywhere), not the order votes hit this token.
+    counts = Counter(color for color in bucket.values() if color)
     if not counts:
         return ""
-    return max(counts.items(), key=lambda item: item[1])[0]
+    return counts.most_common(1)[0][0]
 
 
-def ranges_from_votes(votes: List[Dict[str, str]]) -> List[Dict]:
-    ranges: List[Dict] = []
-    i = 0
-    total = len(votes)
-    while i < total:
-        color = top_color_at(votes[i])
-        if not color:
-            i += 1
-            continue
-        j = i
-        while j + 1 < total and top_color_at(votes[j + 1]) == color:
-            j += 1
-        ranges.append({"start": i, "end": j, "color": color})
-        i = j + 1
-    return ranges
+def ranges_from_votes(votes: Dict[str, Dict[int, str]]) -> List[Dict]:
+    buckets = _token_buckets(votes)
+    runs = _color_runs((idx, top_color_at(buckets[idx])) for idx in sorted(buckets))
+    return [{"start": start, "end": end, "color": color} for start, end, color in runs]
 
 
+@functools.lru_cache(maxsize=4096)
 def hash_id(value: str) -> str:
-    import hashlib
-
     try:
         return hashlib.sha1(value.encode("utf-8")).hexdigest()[:10]
     except Exception:
@@ -1171,73 +1658,86 @@ def _isoformat_utc(ts: float) -> str:
         return ""
 
 
-def client_ranges(tokens: List[str], votes: List[Dict[str, str]], client_id: str) -> List[Dict]:
-    res: List[Dict] = []
-    limit = min(len(tokens), len(votes))
-    idx = 0
-    while idx < limit:
-        color = votes[idx].get(client_id, "")
-        if not color or is_break_token(tokens[idx]):
-            idx += 1
-            continue
-        start = idx
-        j = idx + 1
-        while j < limit and not is_break_token(tokens[j]) and votes[j].get(client_id, "") == color:
-            j += 1
-        res.append({"start": start, "end": j - 1, "color": color})
-        idx = j
-    return res
-
-
-def phrases_aggregated(tokens: List[str], votes: List[Dict[str, str]]) -> List[Dict]:
-    from collections import defaultdict
-
-    n = min(len(tokens), len(votes))
-    clients: Set[str] = set()
-    for idx in range(n):
-        clients.update(votes[idx].keys())
-    by_key: Dict[tuple, Set[str]] = defaultdict(set)
-    for client_id in clients:
+def client_ranges(mask: bytes, votes: Dict[str, Dict[int, str]], client_id: str) -> List[Dict]:
+    bucket = votes.get(client_id)
+    if not bucket:
+        return []
+    return [
+        {"start": start, "end": end, "color": color}
+        for start, end, color in _client_runs(mask, bucket)
+    ]
+
+
+def phrases_aggregated(tokens: List[str], mask: bytes, votes: Dict[str, Dict[int, str]]) -> List[Dict]:
+    # Clients tend to mark the same spans, so group by span first and build each
+    # phrase string once rather than once per client.
+    by_span: Dict[Tuple[int, int, str], Set[str]] = {}
+    for client_id, bucket in votes.items():
         hashed = hash_id(client_id)
-        i = 0
-        while i < n:
-            if is_break_token(tokens[i]):
-                i += 1
-                continue
-            color = votes[i].get(client_id, "")
-            if not color:
-                i += 1
-                continue
-            start = i
-            j = i + 1
-            while j < n and not is_break_token(tokens[j]) and votes[j].get(client_id, "") == color:
-                j += 1
-            phrase_tokens = tokens[start:j]
-            phrase_text = " ".join(phrase_tokens).strip()
-            if phrase_text:
-                key = (phrase_text.lower(), color)
-                by_key[key].add(hashed)
-            i = j
-    result: List[Dict] = []
-    for (text_norm, color), clients_set in by_key.items():
+        for run in _client_runs(mask, bucket):
+            clients = by_span.get(run)
+            if clients is None:
+                by_span[run] = {hashed}
+            else:
+                clients.add(hashed)
+    by_key: Dict[Tuple[str, str], Set[str]] = {}
+    for (start, end, color), clients in by_span.items():
+        text_norm = " ".join(tokens[start:end + 1]).strip().lower()
         if not text_norm:
             continue
-        result.append(
-            {
-                "text": text_norm,
-                "color": color,
-                "clients": sorted(clients_set),
-                "count": len(clients_set),
-            }
-        )
-    return result
+        key = (text_norm, color)
+        merged = by_key.get(key)
+        if merged is None:
+            by_key[key] = clients
+        else:
+            merged |= clients
+    return [
+        {
+            "text": text_norm,
+            "color": color,
+            "clients": sorted(clients_set),
+            "count": len(clients_set),
+        }
+        for (text_norm, color), clients_set in by_key.items()
+    ]
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of the quoted *etag* against an If-None-Match header, as RFC 9110 asks for."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def cached_ranges(state: DocState) -> List[Dict]:
+    cached = state.ranges_cache
+    if cached is not None and cached[0] == state.version:
+        return cached[1]
+    ranges = ranges_from_votes(state.votes_by_client)
+    state.ranges_cache = (state.version, ranges)
+    return ranges
+
+
+def cached_phrases(state: DocState) -> List[Dict]:
+    cached = state.phrases_cache
+    if cached is not None and cached[0] == state.version:
+        return cached[1]
+    phrases = phrases_aggregated(state.tokens, state.break_mask, state.votes_by_client)
+    state.phrases_cache = (state.version, phrases)
+    return phrases
 
 
 @app.middleware("http")
 async def log_requests(request, call_next):
-    LOGGER.info("HTTP %s %s", request.method, request.url.path)
-    response = await call_next(request)
-    return response
+    if LOGGER.isEnabledFor(logging.INFO):
+        LOGGER.info("HTTP %s %s", request.method, request.url.path)
+    return await call_next(request)
 
 
 @app.get("/api/docs")
@@ -1291,7 +1791,7 @@ async def api_state(
         "docId": doc_id,
         "updated": state.updated,
         "tokens_len": len(state.tokens),
-        "ranges": ranges_from_votes(state.votes),
+        "ranges": cached_ranges(state),
     }
     return payload
 
@@ -1305,7 +1805,7 @@ async def api_myranges(
         raise HTTPException(status_code=400, detail="Missing client id")
     doc_id = sanitize_doc_id(doc)
     state = await store.ensure_tokens(doc_id, None)
-    ranges = client_ranges(state.tokens, state.votes, client)
+    ranges = client_ranges(state.break_mask, state.votes_by_client, client)
     return {"docId": doc_id, "ranges": ranges}
 
 
@@ -1313,11 +1813,21 @@ async def api_myranges(
 async def api_phrases(
     doc: Optional[str] = Query(None),
     name: Optional[str] = Query(None),
-) -> Dict:
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
     doc_id = sanitize_doc_id(doc)
     state = await store.ensure_tokens(doc_id, name)
-    phrases = phrases_aggregated(state.tokens, state.votes)
-    return {"docId": doc_id, "updated": state.updated, "phrases": phrases}
+    tag = f'"{ETAG_EPOCH}-{state.version}"'
+    # Weak, because GZipMiddleware may send a different byte body under the same tag;
+    # caches must key on Accept-Encoding too.
+    headers = {"ETag": f"W/{tag}", "Vary": "Accept-Encoding"}
+    if _etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    phrases = cached_phrases(state)
+    return JSON_RESPONSE_CLASS(
+        {"docId": doc_id, "updated": state.updated, "phrases": phrases},
+        headers=headers,
+    )
 
 
 @app.get("/api/control")
@@ -1342,7 +1852,7 @@ async def api_clear(
     doc_id = sanitize_doc_id(doc)
     await store.ensure_tokens(doc_id, name)
     await store.clear_votes(doc_id)
-    await store.broadcast(doc_id, {"type": "state_updated", "docId": doc_id})
+    await store.broadcast_updated(doc_id)
     return {"ok": True, "docId": doc_id, "cleared": "votes"}
 
 
@@ -1353,7 +1863,7 @@ async def api_reset(
 ) -> Dict:
     doc_id = sanitize_doc_id(doc)
     state = await store.retokenize(doc_id, name)
-    await store.broadcast(doc_id, {"type": "state_updated", "docId": doc_id})
+    await store.broadcast_updated(doc_id)
     return {"ok": True, "docId": doc_id, "reset": len(state.tokens), "sourceName": state.source_name}
 
 
@@ -1364,21 +1874,34 @@ async def api_export(
 ):
     doc_id = sanitize_doc_id(doc)
     state = await store.ensure_tokens(doc_id, None)
-    payload = {
-        "docId": doc_id,
-        "locked": store.is_locked(doc_id),
-        "tokens": state.tokens,
-        "votes": state.votes,
-        "updated": state.updated,
-        "sourceName": state.source_name,
-    }
     fmt_lower = (fmt or "json").lower()
     if fmt_lower == "json":
-        return JSONResponse(payload)
+        payload = {
+            "docId": doc_id,
+            "locked": store.is_locked(doc_id),
+            "tokens": state.tokens,
+            "votes": votes_per_token(state.votes_by_client, len(state.tokens)),
+            "updated": state.updated,
+            "sourceName": state.source_name,
+        }
+        return JSON_RESPONSE_CLASS(payload)
     if fmt_lower == "jsonl":
+        # Header line first, then one {clientId: color} line per token, so the
+        # per-token votes list is never built in memory.
+        header = {
+            "docId": doc_id,
+            "locked": store.is_locked(doc_id),
+            "tokens": state.tokens,
+            "updated": state.updated,
+            "sourceName": state.source_name,
+        }
+        buckets = _token_buckets(state.votes_by_client)
         out_path = store._jsonl_path(doc_id)
-        with out_path.open("w", encoding="utf-8") as handle:
-            handle.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        with out_path.open("wb") as handle:
+            handle.write(_dumps(header) + b"\n")
+            for idx in range(len(state.tokens)):
+                bucket = buckets.get(idx)
+                handle.write(_dumps(bucket) + b"\n" if bucket else b"{}\n")
         return FileResponse(
             out_path,
             media_type="application/octet-stream",
@@ -1600,17 +2123,19 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
         state = await store.ensure_tokens(doc_id, None)
         await websocket.send_json({"type": "hello", "docId": doc_id, "locked": store.is_locked(doc_id)})
         if state.tokens:
-            await websocket.send_json(
-                {
-                    "type": "init",
-                    "docId": doc_id,
-                    "ranges": ranges_from_votes(state.votes),
-                    "t": state.updated,
-                }
-            )
+            init = {
+                "type": "init",
+                "docId": doc_id,
+                "ranges": cached_ranges(state),
+                "t": state.updated,
+            }
+            await websocket.send(_text_frame(init))
         while True:
             try:
-                message = await websocket.receive_json()
+                raw = await websocket.receive()
+                if raw["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(raw.get("code", 1000))
+                message = _loads(raw.get("text") or raw.get("bytes") or b"")
             except WebSocketDisconnect:
                 raise
             except Exception as exc:
@@ -1654,11 +2179,11 @@ async def handle_ws_message(doc_id: str, client_id: str, message: Dict) -> None:
         color = message.get("color") or ""
         changed = await store.apply_highlight(doc_id, client_id, start, end, color, timestamp)
         if changed:
-            await store.broadcast(doc_id, {"type": "state_updated", "docId": doc_id})
+            await store.broadcast_updated(doc_id)
     elif action == "clear_all":
         changed = await store.clear_client(doc_id, client_id, timestamp)
         if changed:
-            await store.broadcast(doc_id, {"type": "state_updated", "docId": doc_id})
+            await store.broadcast_updated(doc_id)
 
 
 def main() -> None:
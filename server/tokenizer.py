@@ -10,22 +10,33 @@ import html
 import re
 from typing import Iterable, List
 
-RE_SPLIT = re.compile(r'([\s]+|[.,:;!?()"\-\'\[\]{}«»“”—–…])')
+# One match per token: a punctuation mark, a single newline, or a run of other
+# non-whitespace characters. Any other whitespace separates tokens and is dropped.
+RE_TOKEN = re.compile(r'[.,:;!?()"\-\'\[\]{}«»“”—–…]|\n|[^\s.,:;!?()"\-\'\[\]{}«»“”—–…]+')
 PUNCT_BREAK = set(list('.,:;!?()"\'-[]{}«»“”—–…'))
+# Deleting every break character leaves an empty string iff the token is all punctuation.
+_PUNCT_DELETE = str.maketrans('', '', ''.join(PUNCT_BREAK))
 
-HTML_CLOSE_TO_NL = re.compile(r'(?i)</(p|h1|h2|h3|h4|h5|h6|li|div|section|article|blockquote)>\s*')
-HTML_BR = re.compile(r'(?i)<br\s*/?>')
-HTML_TAGS = re.compile(r'(?is)<[^>]+>')
+# <br> and block-level close tags become newlines, every other tag is dropped. A
+# close tag also swallows the whitespace and <br>s that follow it, so runs such as
+# "</p>\n<br>" collapse to a single newline.
+HTML_MARKUP = re.compile(
+    r'(?is)(?P<nl></(?:p|h1|h2|h3|h4|h5|h6|li|div|section|article|blockquote)>(?:\s|<br\s*/?>)*'
+    r'|<br\s*/?>)'
+    r'|<[^>]+>'
+)
 MULTI_NL = re.compile(r'\n{3,}')
 
 
+def _markup_replacement(match: re.Match) -> str:
+    return '\n' if match.lastgroup == 'nl' else ''
+
+
 def html_to_plain(text: str) -> str:
     """Convert HTML content to plain text while preserving structural breaks."""
     if '<' not in text or '>' not in text:
         return html.unescape(text)
-    text = HTML_BR.sub('\n', text)
-    text = HTML_CLOSE_TO_NL.sub('\n', text)
-    text = HTML_TAGS.sub('', text)
+    text = HTML_MARKUP.sub(_markup_replacement, text)
     text = html.unescape(text)
     text = MULTI_NL.sub('\n\n', text)
     return text
@@ -36,16 +47,7 @@ def tokenize(text: str) -> List[str]:
     Split text into tokens using the canonical regex. Whitespace tokens are
     dropped except for newlines, which are emitted as explicit "\n" tokens.
     """
-    plain = html_to_plain(text)
-    raw = [seg for seg in RE_SPLIT.split(plain) if seg]
-    tokens: List[str] = []
-    for seg in raw:
-        if seg.isspace():
-            newlines = seg.count('\n')
-            tokens.extend('\n' for _ in range(newlines))
-            continue
-        tokens.append(seg)
-    return tokens
+    return RE_TOKEN.findall(html_to_plain(text))
 
 
 def is_break_token(token: str) -> bool:
@@ -54,7 +56,7 @@ def is_break_token(token: str) -> bool:
         return True
     if not token:
         return False
-    return all(char in PUNCT_BREAK for char in token)
+    return not token.translate(_PUNCT_DELETE)
 
 
 def normalised_text(tokens: Iterable[str]) -> str:
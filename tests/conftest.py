@@ -0,0 +1,42 @@
+import importlib
+import importlib.util
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def server_module(tmp_path, monkeypatch):
+    """Import a fresh copy of the server whose data directory lives under tmp_path."""
+    for name in ("server", "public", "wwwdocs"):
+        shutil.copytree(REPO_DIR / name, tmp_path / name)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setenv("HL_FLUSH_INTERVAL", "0.05")
+    monkeypatch.syspath_prepend(str(tmp_path / "server"))
+    for name in ("server", "tokenizer", "markdown_utils"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    module = importlib.import_module("server")
+    yield module
+    for name in ("server", "tokenizer", "markdown_utils"):
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def client(server_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server_module.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def ext_module():
+    """Load the TouchDesigner extension as a plain module; it needs no TD imports."""
+    spec = importlib.util.spec_from_file_location("highlightEXT", REPO_DIR / "touchdesigner" / "highlightEXT.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Paths whose next response is a gzip header over a body that is not gzip.
+    broken: set = set()
+    # Seconds to stall before answering, and the number of GETs served.
+    delay = 0.0
+    served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).served += 1
+        time.sleep(self.delay)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        since = int(query.get("since", ["0"])[0])
+        if url.path == "/api/forms/results":
+            results = [{"seq": i, "clientId": "c", "question": "q", "answer": "a", "submitted": i} for i in (1, 2, 3)]
+            body = {"results": [item for item in results if item["seq"] > since]}
+        elif url.path == "/api/triggers/state":
+            events = [{"seq": i, "buttonId": f"b{i}", "label": "", "direction": "down", "clientId": "c", "timestamp": i} for i in (1, 2, 3)]
+            body = {"events": [item for item in events if item["seq"] > since], "nextSeq": 4}
+        else:
+            body = {"path": url.path}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if url.path in self.broken:
+            self.broken.discard(url.path)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Table:
+    """Minimal stand-in for a Table DAT."""
+
+    def __init__(self):
+        self.rows = []
+
+    def clear(self):
+        self.rows = []
+
+    def appendRow(self, row):
+        self.rows.append(list(row))
+
+    def appendRows(self, rows):
+        self.rows.extend(list(row) for row in rows)
+
+
+@pytest.fixture
+def stub_url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+    _StubHandler.broken.clear()
+    _StubHandler.delay = 0.0
+    _StubHandler.served = 0
+
+
+@pytest.fixture
+def ext(ext_module, stub_url):
+    extension = ext_module.HighlightEXT(None)
+    extension.debug = False
+    extension.SetBaseUrl(stub_url)
+    yield extension
+    extension.StopPolling()
+
+
+def test_failed_body_decode_resets_connection(ext):
+    assert ext._request_json("/echo") == {"path": "/echo"}
+    assert ext._http.conn is not None
+    _StubHandler.broken.add("/echo")
+    assert ext._request_json("/echo") == {}
+    assert ext._http.conn is None
+    assert ext._request_json("/echo") == {"path": "/echo"}
+
+
+def test_polling_and_fetch_keep_separate_cursors(ext):
+    ext.StartPolling(interval_ms=1, doc=None, form="feedback", panel="main")
+    polled_seqs, fetched_seqs = [], []
+    polled_buttons = fetched_buttons = None
+    for _ in range(20):
+        # A Fetch* with other filters runs synchronously while the poll threads keep going.
+        fetched = _Table()
+        ext.FetchFormResults(fetched, include_iso=False)
+        fetched_seqs += [row[0] for row in fetched.rows[1:]]
+        polled = _Table()
+        ext.FetchFormResults(polled)
+        polled_seqs += [row[0] for row in polled.rows[1:]]
+        fetched = _Table()
+        ext.FetchButtonEvents(fetched, include_iso=False)
+        fetched_buttons = fetched.rows
+        polled = _Table()
+        ext.FetchButtonEvents(polled)
+        polled_buttons = polled.rows or polled_buttons
+    assert sorted(fetched_seqs) == [1, 2, 3]
+    assert sorted(polled_seqs) == [1, 2, 3]
+    assert [len(row) for row in fetched_buttons] == [6] * 4
+    assert [row[0] for row in polled_buttons[1:]] == [1, 2, 3]
+    assert [len(row) for row in polled_buttons] == [7] * 4
+
+
+def test_stop_polling_does_not_wait_for_requests(ext):
+    _StubHandler.delay = 2.0
+    ext.StartPolling(doc=None, form="feedback", panel=None)
+    time.sleep(0.2)
+    started = time.monotonic()
+    ext.onDestroyTD()
+    assert time.monotonic() - started < 0.5
+    # The stopped poller's late rows must not move the cursor past what a sync fetch still needs.
+    _StubHandler.delay = 0.0
+    time.sleep(2.2)
+    table = _Table()
+    ext.FetchFormResults(table)
+    assert [row[0] for row in table.rows[1:]] == [1, 2, 3]
+
+
+def test_untaken_poll_rows_are_fetched_after_stop(ext, ext_module):
+    ext.StartPolling(interval_ms=0, doc=None, form="feedback", panel=None)
+    time.sleep(0.3)
+    # A zero interval is clamped instead of spinning against the server.
+    assert _StubHandler.served <= 0.3 * 1000 / ext_module.MIN_POLL_INTERVAL_MS + 2
+    ext.StopPolling()
+    table = _Table()
+    ext.FetchFormResults(table)
+    assert [row[0] for row in table.rows[1:]] == [1, 2, 3]
@@ -0,0 +1,131 @@
+def test_agreement_accepts_big_int_meta(client, server_module):
+    big = 10**30
+    first = client.post("/api/agreement/accept", json={"clientId": "a", "meta": {"n": big}})
+    assert first.status_code == 200
+    assert first.json()["meta"] == {"n": big}
+    # A stored big int must not break later accepts or reads.
+    second = client.post("/api/agreement/accept", json={"clientId": "b"})
+    assert second.status_code == 200
+    records = client.get("/api/agreement/records")
+    assert records.status_code == 200
+    reloaded = server_module.AgreementManager()._ensure_loaded()
+    assert reloaded.accepted["a"]["meta"] == {"n": big}
+
+
+def test_snapshot_written_by_stdlib_json_loads(server_module):
+    import asyncio
+    import json
+    import math
+
+    store = server_module.DocumentStore()
+    payload = {"tokens": ["a", " ", "b"], "votesByClient": {"a": [[0, 0, "c1"]]}, "updated": float("nan")}
+    store._state_path("t1").write_text(json.dumps(payload), encoding="utf-8")
+    state = asyncio.run(store.get_state("t1"))
+    assert state.votes_by_client == {"a": {0: "c1"}}
+    assert math.isnan(state.updated)
+
+
+def test_dumps_falls_back_for_values_orjson_rejects(server_module):
+    import json
+
+    payload = {"n": 10**30, "nested": [-(10**25)]}
+    assert json.loads(server_module._dumps(payload)) == payload
+
+
+def test_tied_token_goes_to_earliest_client_in_document(server_module):
+    # "b" voted on token 1 before "a" did, but "a" voted first in the document.
+    votes = {"a": {0: "c1", 1: "c1"}, "b": {1: "c2"}}
+    assert server_module.ranges_from_votes(votes) == [{"start": 0, "end": 1, "color": "c1"}]
+    votes = {"b": {1: "c2"}, "a": {0: "c1", 1: "c1"}}
+    assert server_module.ranges_from_votes(votes) == [
+        {"start": 0, "end": 0, "color": "c1"},
+        {"start": 1, "end": 1, "color": "c2"},
+    ]
+
+
+def test_tie_break_order_survives_snapshot_reload(server_module, tmp_path):
+    import asyncio
+
+    async def scenario():
+        store = server_module.DocumentStore()
+        await store.ensure_tokens("t1", "text.md")
+        await store.apply_highlight("t1", "a", 0, 1, "c1", None)
+        await store.apply_highlight("t1", "b", 1, 1, "c2", None)
+        before = server_module.ranges_from_votes((await store.get_state("t1")).votes_by_client)
+        await store.flush(compact=True)
+        reloaded = server_module.DocumentStore()
+        after = server_module.ranges_from_votes((await reloaded.get_state("t1")).votes_by_client)
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == after == [{"start": 0, "end": 1, "color": "c1"}]
+
+
+def test_non_string_color_survives_snapshot_reload(server_module):
+    import asyncio
+
+    async def scenario():
+        store = server_module.DocumentStore()
+        await store.ensure_tokens("t1", "text.md")
+        # WebSocket messages pass the color through unchecked.
+        await store.apply_highlight("t1", "a", 0, 1, 5, None)
+        await store.flush(compact=True)
+        reloaded = server_module.DocumentStore()
+        return (await reloaded.get_state("t1")).votes_by_client
+
+    assert asyncio.run(scenario()) == {"a": {0: 5, 1: 5}}
+
+
+def test_replay_drops_torn_log_tail(server_module):
+    import asyncio
+
+    async def scenario():
+        store = server_module.DocumentStore()
+        await store.ensure_tokens("t1", "text.md")
+        await store.apply_highlight("t1", "a", 0, 0, "c1", None)
+        await store.flush()
+        # Simulate a crash halfway through appending the next event.
+        with store._log_path("t1").open("ab") as handle:
+            handle.write(b'{"t":"hl","c":"y","s":1,"e":1,"col":"c2","n":2')
+        restarted = server_module.DocumentStore()
+        await restarted.apply_highlight("t1", "z", 2, 2, "c3", None)
+        await restarted.flush()
+        reloaded = server_module.DocumentStore()
+        return (await reloaded.get_state("t1")).votes_by_client
+
+    assert asyncio.run(scenario()) == {"a": {0: "c1"}, "z": {2: "c3"}}
+
+
+def test_repeat_check_matches_before_and_after_reload(server_module, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(server_module, "MAX_FORM_RESPONSES", 2)
+
+    async def scenario():
+        forms = server_module.FormManager()
+        await forms.update_config("f1", allow_repeat=False)
+        for client_id in ("a", "b", "c"):
+            await forms.submit("f1", client_id, "answer")
+        await forms.flush()
+        live = forms._ensure_loaded("f1").client_counts
+        reloaded = server_module.FormManager()._ensure_loaded("f1").client_counts
+        return dict(live), dict(reloaded)
+
+    live, reloaded = asyncio.run(scenario())
+    # "a" aged out of the two-entry log, so it may answer again on both paths.
+    assert live == reloaded == {"b": 1, "c": 1}
+
+
+def test_phrases_etag_revalidation(client):
+    client.get("/api/tokens?doc=e1&name=text.md")
+    first = client.get("/api/phrases?doc=e1")
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert "Accept-Encoding" in first.headers["vary"]
+    for header in (etag, etag[2:], f'"other", {etag}', "*"):
+        response = client.get("/api/phrases?doc=e1", headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.headers["etag"] == etag
+        assert "Accept-Encoding" in response.headers["vary"]
+    stale = client.get("/api/phrases?doc=e1", headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
@@ -13,10 +13,70 @@ All methods accept either a DAT operator or operator path for the output
 table. Table columns are always replaced with fresh data.
 """
 
+import functools
+import gzip
 import json
-from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional
-from urllib import request as _urlreq
+import ssl
+import threading
+import time
+from collections import deque
+from http import client as _httpclient
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+
+try:
+    import orjson
+except ImportError:  # TouchDesigner's bundled Python may not ship it
+    orjson = None
+
+# Responses at least this large are parsed item by item when ijson is available.
+STREAM_MIN_BYTES = 64 * 1024
+# Floor for StartPolling's interval, so a 0 does not spin the pollers against the server.
+MIN_POLL_INTERVAL_MS = 50
+
+
+@functools.lru_cache(maxsize=None)
+def _ijson() -> Any:
+    """Import ijson on the first large response (it is slow to load); None if missing."""
+    try:
+        import ijson
+    except ImportError:
+        return None
+    return ijson
+
+
+if orjson is not None:
+    _loads = orjson.loads
+else:
+
+    def _loads(raw: Union[bytes, memoryview]) -> Any:
+        return json.loads(str(raw, "utf-8", errors="ignore"))
+
+
+def _decode_object(raw: Union[bytes, memoryview]) -> Dict[str, Any]:
+    """Parse a response body; anything but a JSON object becomes ``{}``."""
+    payload = _loads(raw) if raw else {}
+    return payload if isinstance(payload, dict) else {}
+
+
+PHRASE_HEADERS = ["text", "color", "count", "clients"]
+FORM_HEADERS = ["seq", "clientId", "question", "answer", "submitted", "submitted_iso"]
+BUTTON_HEADERS = ["seq", "buttonId", "label", "direction", "clientId", "timestamp", "timestamp_iso"]
+
+
+class _HttpState(threading.local):
+    """Per-thread keep-alive connection, so background pollers never share a socket."""
+
+    def __init__(self) -> None:
+        # Kept open between polls; rebuilt whenever base_url changes.
+        self.conn: Optional[_httpclient.HTTPConnection] = None
+        self.base: Optional[str] = None
+        self.prefix = ""
+        self.headers: Dict[str, str] = {}
+        # url -> (ETag, parsed payload) for conditional GETs.
+        self.etags: Dict[str, Tuple[str, Any]] = {}
+        # Reused for every response body with a Content-Length; grows as needed.
+        self.buf = bytearray(16 * 1024)
 
 
 class HighlightEXT:
@@ -26,8 +86,17 @@ class HighlightEXT:
         self.ownerComp = ownerComp
         self.base_url = "http://127.0.0.1:9888"
         self.webclient = None
-        self._form_cursor: Dict[str, int] = {}
-        self._button_cache: Dict[str, Dict[str, Any]] = {}
+        self._http = _HttpState()
+        self._sslctx: Optional[ssl.SSLContext] = None
+        # Keyed by the fetch arguments, so a poll thread and a Fetch* call with
+        # other filters never advance each other's cursor.
+        self._form_cursor: Dict[Tuple[str, bool], int] = {}
+        self._button_cache: Dict[Tuple[str, int, bool, bool], Dict[str, Any]] = {}
+        # Background polling: job key -> latest rows, filled by StartPolling threads.
+        self._poll_lock = threading.Lock()
+        self._poll_stop: Optional[threading.Event] = None
+        self._poll_keys: set = set()
+        self._latest: Dict[tuple, Any] = {}
 
     # ------------------------------------------------------------------
     # configuration helpers
@@ -43,6 +112,79 @@ class HighlightEXT:
     def SetBaseUrl(self, url: str):
         self.base_url = url.rstrip("/")
 
+    def StartPolling(  # type: ignore[no-untyped-def]
+        self,
+        interval_ms: int = 500,
+        doc: Optional[str] = "doc1",
+        form: Optional[str] = "feedback",
+        panel: Optional[str] = "main",
+        min_count: int = 1,
+        color_filter: Optional[str] = None,
+        incremental: bool = True,
+        max_events: int = 128,
+        include_iso: bool = True,
+    ) -> None:
+        """Poll phrases, form results and button events on background threads.
+
+        Each endpoint gets its own daemon thread and connection, so a slow one does
+        not hold up the others or TouchDesigner's cook. Fetch* calls with matching
+        arguments then only write the latest rows; pass ``None`` to skip an endpoint.
+        """
+
+        self.StopPolling()
+        jobs = []
+        if doc is not None:
+            jobs.append(
+                (("phrases", doc, min_count, color_filter), lambda: self._phrase_rows(doc, min_count, color_filter))
+            )
+        if form is not None:
+            jobs.append(
+                (
+                    ("form", form, incremental, include_iso),
+                    # The cursor only advances once the rows are stored, so a stopped poller cannot skip any.
+                    lambda: self._form_rows(form, incremental, include_iso, advance=False),
+                )
+            )
+        if panel is not None:
+            jobs.append(
+                (
+                    ("buttons", panel, max_events, incremental, include_iso),
+                    lambda: self._button_rows(panel, max_events, incremental, include_iso),
+                )
+            )
+        stop = threading.Event()
+        with self._poll_lock:
+            self._poll_stop = stop
+            self._poll_keys = {key for key, _ in jobs}
+            self._latest = {}
+        interval = max(MIN_POLL_INTERVAL_MS, interval_ms) / 1000.0
+        for key, job in jobs:
+            threading.Thread(
+                target=self._poll_loop, args=(key, job, interval, stop), name=f"highlightEXT-{key[0]}", daemon=True
+            ).start()
+
+    def StopPolling(self) -> None:
+        """Stop background polling; Fetch* calls go back to fetching synchronously.
+
+        Does not wait for the threads: one still mid-request exits when it returns and drops its rows.
+        """
+
+        with self._poll_lock:
+            if self._poll_stop is not None:
+                self._poll_stop.set()
+                self._poll_stop = None
+            for key, rows in self._latest.items():
+                if key[0] == "form" and key[2] and rows:
+                    # Untaken deltas would be lost; rewind so the next fetch asks for them again.
+                    self._form_cursor[(key[1], key[3])] = min(row[0] for row in rows) - 1
+            self._poll_keys = set()
+            self._latest = {}
+
+    def onDestroyTD(self) -> None:
+        """Called by TouchDesigner before the extension is re-initialised or its COMP is deleted."""
+
+        self.StopPolling()
+
     # ------------------------------------------------------------------
     # public fetchers
     # ------------------------------------------------------------------
@@ -55,61 +197,30 @@ class HighlightEXT:
     ) -> None:
         """Populate *target* table with phrases aggregate."""
 
-        payload = self._request_json("/api/phrases", params={"doc": doc})
-        phrases = payload.get("phrases", []) if isinstance(payload, dict) else []
-        rows = []
-        for item in phrases:
-            count = int(item.get("count", 0))
-            if count < min_count:
-                continue
-            color = item.get("color") or ""
-            if color_filter and color != color_filter:
-                continue
-            rows.append(
-                [
-                    item.get("text", ""),
-                    color,
-                    count,
-                    ", ".join(item.get("clients", [])),
-                ]
-            )
-        self._write_table(target, ["text", "color", "count", "clients"], rows)
+        polled, rows = self._take_polled(("phrases", doc, min_count, color_filter))
+        if not polled:
+            rows = self._phrase_rows(doc, min_count, color_filter)
+        if rows is not None:
+            self._write_table(target, PHRASE_HEADERS, rows)
 
     def FetchFormResults(  # type: ignore[no-untyped-def]
         self,
         target,
         form: str = "feedback",
         incremental: bool = True,
+        include_iso: bool = True,
     ) -> None:
-        """Populate *target* with feedback responses."""
+        """Populate *target* with feedback responses.
 
-        params: Dict[str, Any] = {"form": form}
-        if incremental:
-            since = self._form_cursor.get(form)
-            if since:
-                params["since"] = since
-        payload = self._request_json("/api/forms/results", params=params)
-        results = payload.get("results", []) if isinstance(payload, dict) else []
-        if incremental and results:
-            last_seq = max(int(r.get("seq", 0)) for r in results)
-            if last_seq:
-                self._form_cursor[form] = last_seq
-        rows = []
-        for item in results:
-            ts = item.get("submitted")
-            iso = self._iso_from_timestamp(ts)
-            rows.append(
-                [
-                    int(item.get("seq", 0)),
-                    item.get("clientId", ""),
-                    item.get("question", ""),
-                    item.get("answer", ""),
-                    ts,
-                    iso,
-                ]
-            )
-        headers = ["seq", "clientId", "question", "answer", "submitted", "submitted_iso"]
-        self._write_table(target, headers, rows)
+        Pass ``include_iso=False`` to drop the formatted ``submitted_iso`` column.
+        """
+
+        polled, rows = self._take_polled(("form", form, incremental, include_iso))
+        if not polled:
+            rows = self._form_rows(form, incremental, include_iso)
+        if rows is not None:
+            headers = FORM_HEADERS if include_iso else FORM_HEADERS[:-1]
+            self._write_table(target, headers, rows)
 
     def FetchButtonEvents(  # type: ignore[no-untyped-def]
         self,
@@ -117,52 +228,162 @@ class HighlightEXT:
         panel: str = "main",
         max_events: int = 128,
         incremental: bool = True,
+        include_iso: bool = True,
     ) -> None:
-        """Populate *target* with button press events and counts."""
+        """Populate *target* with button press events and counts.
+
+        Pass ``include_iso=False`` to drop the formatted ``timestamp_iso`` column.
+        """
+
+        polled, rows = self._take_polled(("buttons", panel, max_events, incremental, include_iso))
+        if not polled:
+            rows = self._button_rows(panel, max_events, incremental, include_iso)
+        if rows is not None:
+            headers = BUTTON_HEADERS if include_iso else BUTTON_HEADERS[:-1]
+            self._write_table(target, headers, rows)
+
+    # ------------------------------------------------------------------
+    # table builders
+    # ------------------------------------------------------------------
+    def _phrase_rows(self, doc: str, min_count: int, color_filter: Optional[str]) -> List[List[Any]]:
+        phrases = self._request_items("/api/phrases", "phrases", params={"doc": doc})
+        if color_filter:
+            phrases = (item for item in phrases if (item.get("color") or "") == color_filter)
+        return [
+            [item.get("text", ""), item.get("color") or "", count, ", ".join(item.get("clients", []))]
+            for item in phrases
+            if (count := int(item.get("count", 0))) >= min_count
+        ]
+
+    def _form_rows(
+        self, form: str, incremental: bool, include_iso: bool = True, advance: bool = True
+    ) -> List[List[Any]]:
+        params: Dict[str, Any] = {"form": form}
+        if incremental:
+            since = self._form_cursor.get((form, include_iso))
+            if since:
+                params["since"] = since
+        payload = self._request_json("/api/forms/results", params=params)
+        results = payload.get("results", [])
+        rows = [
+            [
+                int(item.get("seq", 0)),
+                item.get("clientId", ""),
+                item.get("question", ""),
+                item.get("answer", ""),
+                item.get("submitted"),
+            ]
+            for item in results
+        ]
+        if include_iso:
+            iso = self._iso_from_timestamp
+            for row in rows:
+                row.append(iso(row[4]))
+        if advance:
+            self._advance_form_cursor(form, incremental, include_iso, rows)
+        return rows
+
+    def _advance_form_cursor(self, form: str, incremental: bool, include_iso: bool, rows: List[List[Any]]) -> None:
+        if incremental and rows:
+            # Reuse the seq ints already parsed into the first column.
+            last_seq = max(row[0] for row in rows)
+            if last_seq:
+                self._form_cursor[(form, include_iso)] = last_seq
 
-        cache = self._button_cache.setdefault(panel, {"nextSeq": 0, "events": []})
+    def _button_rows(
+        self, panel: str, max_events: int, incremental: bool, include_iso: bool = True
+    ) -> List[List[Any]]:
+        iso = self._iso_from_timestamp
+        # Rows are formatted once when an event arrives and reused on later polls.
+        cache = self._button_cache.setdefault(
+            (panel, max_events, incremental, include_iso), {"nextSeq": 0, "rows": deque(maxlen=max_events)}
+        )
         params: Dict[str, Any] = {"panel": panel}
-        if incremental and cache.get("nextSeq"):
-            params["since"] = cache["nextSeq"] - 1
+        next_seq = cache["nextSeq"]
+        if incremental and next_seq:
+            params["since"] = next_seq - 1
         payload = self._request_json("/api/triggers/state", params=params)
-        if not isinstance(payload, dict):
-            return
         events = payload.get("events", []) or []
         if events:
-            cache["events"].extend(events)
-            cache["events"] = cache["events"][-max_events:]
-        cache["nextSeq"] = payload.get("nextSeq", cache.get("nextSeq", 0))
-        rows = []
-        for item in cache["events"]:
-            ts = item.get("timestamp")
-            rows.append(
+            rows = [
                 [
                     int(item.get("seq", 0)),
                     item.get("buttonId", ""),
                     item.get("label", ""),
                     item.get("direction", ""),
                     item.get("clientId", ""),
-                    ts,
-                    self._iso_from_timestamp(ts),
+                    item.get("timestamp"),
                 ]
-            )
-        headers = ["seq", "buttonId", "label", "direction", "clientId", "timestamp", "timestamp_iso"]
-        self._write_table(target, headers, rows)
+                for item in events
+            ]
+            if include_iso:
+                for row in rows:
+                    row.append(iso(row[5]))
+        with self._poll_lock:
+            # A stopped poller may still be finishing a request for the same cache; whichever
+            # call lands second sees nextSeq moved and keeps the cache as the first one left it.
+            if cache["nextSeq"] == next_seq:
+                if events:
+                    cache["rows"].extend(rows)
+                cache["nextSeq"] = payload.get("nextSeq", next_seq)
+            return list(cache["rows"])
 
     # ------------------------------------------------------------------
     # internal helpers
     # ------------------------------------------------------------------
+    def _poll_loop(
+        self, key: tuple, job: Callable[[], Optional[List[List[Any]]]], interval: float, stop: threading.Event
+    ) -> None:
+        while not stop.is_set():
+            try:
+                rows = job()
+            except Exception as e:
+                if getattr(self, "debug", True):
+                    print("[highlightEXT] poll error:", key[0], e)
+                rows = None
+            if rows is not None:
+                with self._poll_lock:
+                    if stop.is_set():
+                        break
+                    if key[0] == "form" and key[2]:
+                        # Incremental form rows are deltas; keep them until a Fetch takes them.
+                        self._latest.setdefault(key, []).extend(rows)
+                        self._advance_form_cursor(key[1], key[2], key[3], rows)
+                    else:
+                        self._latest[key] = rows
+            stop.wait(interval)
+        self._close_connection()
+
+    def _take_polled(self, key: tuple) -> Tuple[bool, Optional[List[List[Any]]]]:
+        """Return ``(polled, rows)``; rows is None while the first poll is still running."""
+        with self._poll_lock:
+            if key not in self._poll_keys:
+                return False, None
+            if key[0] == "form" and key[2]:
+                return True, self._latest.pop(key, [])
+            return True, self._latest.get(key)
+
     def _request_json(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Synchronous HTTP GET that returns parsed JSON. Does not rely on Web Client DAT."""
-        url = self._build_url(endpoint, params)
+        path = self._build_path(endpoint, params)
+        url = f"{self.base_url}{path}"
+        cached = self._http.etags.get(url)
         try:
-            with _urlreq.urlopen(url, timeout=5) as resp:
-                raw = resp.read()
-            if isinstance(raw, (bytes, bytearray)):
-                raw = raw.decode("utf-8", errors="ignore")
-            if not raw:
-                return {}
-            return json.loads(raw)
+            resp = self._send(path, etag=cached[0] if cached else None)
+            try:
+                if resp.status == 304 and cached:
+                    resp.read()
+                    return cached[1]
+                raw = self._read_body(resp)
+                if resp.status >= 400:
+                    raise OSError(f"HTTP {resp.status}")
+                payload = _decode_object(raw)
+            except Exception:
+                # Never reuse a connection whose body may be half-read.
+                self._close_connection()
+                raise
+            self._remember_etag(url, resp, payload)
+            return payload
         except Exception as e:
             # Лаконичный лог + пустой результат, чтобы не ронять цикл
             debug = getattr(self, "debug", True)
@@ -170,33 +391,165 @@ class HighlightEXT:
                 print("[highlightEXT] _request_json error:", e, "URL:", url)
             return {}
 
+    def _request_items(
+        self, endpoint: str, key: str, params: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield the entries of the *key* list in the JSON response.
+
+        Large bodies are parsed incrementally with ijson when it is installed, so
+        callers filtering the items never hold the whole payload.
+        """
+        path = self._build_path(endpoint, params)
+        url = f"{self.base_url}{path}"
+        cached = self._http.etags.get(url)
+        done = False
+        try:
+            resp = self._send(path, etag=cached[0] if cached else None)
+            length = int(resp.getheader("Content-Length") or 0)
+            if resp.status == 304 and cached:
+                resp.read()
+                payload = cached[1]
+            elif resp.status >= 400:
+                resp.read()
+                raise OSError(f"HTTP {resp.status}")
+            elif length < STREAM_MIN_BYTES or _ijson() is None:
+                raw = self._read_body(resp)
+                payload = _decode_object(raw)
+                self._remember_etag(url, resp, payload)
+            else:
+                payload = None
+            if payload is not None:
+                yield from payload.get(key, [])
+            else:
+                # Streamed bodies are not kept, so they cannot be revalidated.
+                self._http.etags.pop(url, None)
+                if resp.getheader("Content-Encoding") == "gzip":
+                    body = gzip.GzipFile(fileobj=resp)
+                else:
+                    body = resp
+                yield from _ijson().items(body, f"{key}.item")
+                # ijson stops after the list; drain the rest so the connection stays usable.
+                resp.read()
+            done = True
+        except Exception as e:
+            self._close_connection()
+            if getattr(self, "debug", True):
+                print("[highlightEXT] _request_items error:", e, "URL:", url)
+            done = True
+        finally:
+            if not done:
+                # The caller stopped early and left the body half-read.
+                self._close_connection()
+
+    def _remember_etag(self, url: str, resp: _httpclient.HTTPResponse, payload: Any) -> None:
+        etag = resp.getheader("ETag")
+        if etag:
+            self._http.etags[url] = (etag, payload)
+        else:
+            self._http.etags.pop(url, None)
+
+    def _read_body(self, resp: _httpclient.HTTPResponse) -> Union[bytes, memoryview]:
+        """Read the body into this thread's buffer; the view is only valid until the next read."""
+        length = int(resp.getheader("Content-Length") or 0)
+        if length:
+            if len(self._http.buf) < length:
+                self._http.buf = bytearray(length)
+            view = memoryview(self._http.buf)[:length]
+            filled = 0
+            while filled < length:
+                n = resp.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            if filled < length:
+                raise _httpclient.IncompleteRead(bytes(view[:filled]), length - filled)
+            raw: Union[bytes, memoryview] = view[:filled]
+        else:
+            raw = resp.read()
+        if resp.getheader("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return raw
+
+    def _send(self, path: str, etag: Optional[str] = None) -> _httpclient.HTTPResponse:
+        """Send a GET for *path* and return the response with its body still unread."""
+        for _ in range(2):
+            reused = self._http.conn is not None and self._http.base == self.base_url
+            conn = self._connection()
+            headers = self._http.headers
+            if etag:
+                headers = {**headers, "If-None-Match": etag}
+            try:
+                conn.request("GET", self._http.prefix + path, headers=headers)
+                return conn.getresponse()
+            except (ConnectionError, _httpclient.HTTPException):
+                # The server may have dropped an idle keep-alive socket; retry once on a new one.
+                self._close_connection()
+                if not reused:
+                    raise
+            except Exception:
+                self._close_connection()
+                raise
+        raise ConnectionError("no response")
+
+    def _connection(self) -> _httpclient.HTTPConnection:
+        if self._http.conn is None or self._http.base != self.base_url:
+            self._close_connection()
+            parts = urlsplit(self.base_url)
+            host = parts.hostname or "127.0.0.1"
+            if parts.scheme == "https":
+                self._http.conn = _httpclient.HTTPSConnection(
+                    host, parts.port, timeout=5, context=self._ssl_context()
+                )
+            else:
+                self._http.conn = _httpclient.HTTPConnection(host, parts.port, timeout=5)
+            # Compression only pays off over a real network, not on loopback.
+            local = host in ("127.0.0.1", "localhost", "::1")
+            self._http.headers = {} if local else {"Accept-Encoding": "gzip"}
+            self._http.base = self.base_url
+            self._http.prefix = parts.path.rstrip("/")
+        return self._http.conn
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        # Built on first HTTPS use and shared by every connection after that.
+        if self._sslctx is None:
+            self._sslctx = ssl.create_default_context()
+        return self._sslctx
+
+    def _close_connection(self) -> None:
+        if self._http.conn is not None:
+            try:
+                self._http.conn.close()
+            except Exception:
+                pass
+        self._http.conn = None
+        self._http.base = None
+
     def _build_url(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return f"{self.base_url}{self._build_path(endpoint, params)}"
+
+    def _build_path(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
         endpoint = endpoint or "/"
         if not endpoint.startswith("/"):
             endpoint = "/" + endpoint
-        url = f"{self.base_url}{endpoint}"
-        if params:
-            pairs = []
-            for key, value in params.items():
-                if value is None:
-                    continue
-                if isinstance(value, (list, tuple)):
-                    for item in value:
-                        pairs.append(f"{key}={item}")
-                else:
-                    pairs.append(f"{key}={value}")
-            if pairs:
-                url += "?" + "&".join(pairs)
-        return url
+        if not params:
+            return endpoint
+        query = urlencode({k: v for k, v in params.items() if v is not None}, doseq=True)
+        return f"{endpoint}?{query}" if query else endpoint
 
     def _write_table(self, target, headers: Iterable[str], rows: Iterable[Iterable[Any]]) -> None:
         dat = self._resolve_dat(target)
         if dat is None:
             raise ValueError("Target DAT not found")
+        table = [list(headers)]
+        table.extend(["" if v is None else v for v in row] for row in rows)
         dat.clear()
-        dat.appendRow(list(headers))
-        for row in rows:
-            dat.appendRow(["" if v is None else v for v in row])
+        append_rows = getattr(dat, "appendRows", None)
+        if append_rows is not None:
+            # One call into the DAT instead of one per row.
+            append_rows(table)
+        else:
+            for row in table:
+                dat.appendRow(row)
 
     def _resolve_dat(self, target):  # type: ignore[no-untyped-def]
         if target is None:
@@ -210,7 +563,7 @@ class HighlightEXT:
             ts = float(value)
         except (TypeError, ValueError):
             return ""
-        return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="seconds")
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
 
 
     def SendNavigate(self, target: str, group: str = "all",
@@ -228,11 +581,15 @@ class HighlightEXT:
             "preserveClient": preserveClient,
             "preserveParams": preserveParams
         }
+        # urllib.request is only needed here, so keep it out of extension load time.
+        from urllib import request as _urlreq
+
         data = json.dumps(payload).encode("utf-8")
         req = _urlreq.Request(url, data=data, method='POST',
                             headers={'Content-Type': 'application/json'})
         try:
-            with _urlreq.urlopen(req, timeout=5) as resp:
+            context = self._ssl_context() if url.startswith("https:") else None
+            with _urlreq.urlopen(req, timeout=5, context=context) as resp:
                 return 200 <= resp.status < 300
         except Exception as e:
             if getattr(self, "debug", True):